@@ -0,0 +1,96 @@
+import math
+
+
+class Aggregates:
+    """Running dashboard totals, kept up to date by the mutation routes.
+
+    Amounts are summed as integer cents so repeated adds and deletes never
+    drift the way a running float total would.
+    """
+
+    def __init__(self, categories, idea_statuses):
+        self.balance_cents = 0
+        self.transaction_count = 0
+        self.idea_count = 0
+        self.category_cents = {category: 0 for category in categories}
+        self.status_counts = {status: 0 for status in idea_statuses}
+
+    @property
+    def balance(self):
+        return self.balance_cents / 100
+
+    @property
+    def category_totals(self):
+        return {category: cents / 100 for category, cents in self.category_cents.items()}
+
+    @property
+    def active_ideas_count(self):
+        return self.idea_count - self.status_counts.get('Completed', 0)
+
+    def add_transaction(self, transaction):
+        cents = to_cents(transaction.get('amount', 0))
+        category = transaction.get('category')
+        self.balance_cents += cents
+        self.transaction_count += 1
+        self.category_cents[category] = self.category_cents.get(category, 0) + cents
+
+    def remove_transaction(self, transaction):
+        cents = to_cents(transaction.get('amount', 0))
+        category = transaction.get('category')
+        self.balance_cents -= cents
+        self.transaction_count -= 1
+        self.category_cents[category] = self.category_cents.get(category, 0) - cents
+
+    def load_transactions(self, columns):
+        """Replace the transaction totals with vectorised sums over
+        ``columns`` (a :class:`columns.TransactionColumns`)."""
+        self.transaction_count = len(columns)
+        self.balance_cents = columns.sum_cents()
+        self.category_cents = {category: 0 for category in self.category_cents}
+        for category in columns.category_names:
+            cents = columns.sum_cents(category=category)
+            if cents or category in self.category_cents:
+                self.category_cents[category] = cents
+
+    def add_idea(self, idea):
+        status = idea.get('status')
+        self.idea_count += 1
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def remove_idea(self, idea):
+        status = idea.get('status')
+        self.idea_count -= 1
+        self.status_counts[status] = self.status_counts.get(status, 0) - 1
+
+    def figures(self):
+        """The totals in cents, as plain data."""
+        return {
+            'balance_cents': self.balance_cents,
+            'transaction_count': self.transaction_count,
+            'idea_count': self.idea_count,
+            'active_ideas_count': self.active_ideas_count,
+            'category_cents': dict(self.category_cents),
+        }
+
+    def to_dict(self):
+        return {
+            'total_balance': self.balance,
+            'transaction_count': self.transaction_count,
+            'idea_count': self.idea_count,
+            'active_ideas_count': self.active_ideas_count,
+            'category_totals': self.category_totals,
+            'status_counts': dict(self.status_counts),
+        }
+
+
+# Largest amount one transaction may hold. Its cents fit the int64 columns
+# with room to spare, so balances and bucket sums cannot overflow either
+MAX_AMOUNT = 10 ** 12
+
+
+def to_cents(amount):
+    return int(round(float(amount) * 100))
+
+
+def valid_amount(amount):
+    return math.isfinite(amount) and abs(amount) <= MAX_AMOUNT
@@ -1,28 +1,71 @@
-from flask import Flask, render_template_string, request, redirect, jsonify
+from flask import Flask, Response, render_template, make_response, request, redirect, jsonify, abort, send_from_directory, g
 from datetime import datetime
+import atexit
+import csv
+import hashlib
 import json
+import mimetypes
+import os
+import resource
+import threading
+import time
 
-app = Flask(__name__)
+from search import tokenize
+from aggregates import MAX_AMOUNT, valid_amount
+from columns import period_bounds
+from ledgers import DEFAULT_LEDGER, Ledgers
+from events import RESYNC, Broadcaster, format_event
+from metrics import Registry
+from series import BUCKETS
+from transfer import EXPORTERS, EXPORT_TYPES, FIELDS, READERS, Normalizer, RowError, detect_format, text_stream
+from werkzeug.local import LocalProxy
+
+# Static files are served by the static_asset route below
+app = Flask(__name__, static_folder=None)
+
+DATA_DIR = os.environ.get('OSONAI_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
 
 # Data structures
-ideas = []
-transactions = []
 categories = ["Personal", "Business", "Investment", "Savings"]
 idea_statuses = ["New", "In Progress", "Completed", "On Hold"]
+ledgers = Ledgers(DATA_DIR, categories, idea_statuses)
+atexit.register(ledgers.close)
 
-@app.route("/")
-def home():
-    return render_template_string('''
+# The store of the ledger a request works on, chosen in sync_store; routes
+# only ever touch that one ledger's data and lock
+store = LocalProxy(lambda: g.store)
+
+# Request metrics, merged across worker processes through DATA_DIR/metrics
+metrics = Registry(os.path.join(DATA_DIR, 'metrics'))
+metrics.describe('osonai_requests_total', 'counter', 'Requests by route, method and status.')
+metrics.describe('osonai_request_seconds', 'histogram', 'Request latency by route and method.')
+metrics.describe('osonai_home_aggregate_seconds', 'histogram', 'Time gathering the dashboard data on a page cache miss.')
+metrics.describe('osonai_home_render_seconds', 'histogram', 'Time rendering the dashboard template on a page cache miss.')
+metrics.describe('osonai_home_cache_total', 'counter', 'Dashboard page cache lookups by result.')
+metrics.describe('osonai_transactions', 'gauge', 'Transactions in each ledger.')
+metrics.describe('osonai_ideas', 'gauge', 'Ideas in each ledger.')
+metrics.describe('osonai_max_rss_bytes', 'gauge', 'Peak resident memory of the worker process.')
+
+HOME_TEMPLATE = '''
         <!DOCTYPE html>
         <html lang="en">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Osonai - Advanced Banking & Ideas Platform</title>
+            {% if assets %}
+            <link rel="preload" href="/static/{{ assets['space-grotesk.woff2'] }}" as="font" type="font/woff2" crossorigin>
+            <link rel="stylesheet" href="/static/{{ assets['app.css'] }}">
+            <script src="/static/{{ assets['chart.js'] }}"></script>
+            <script src="/static/{{ assets['alpine.js'] }}" defer></script>
+            {% else %}
+            <!-- Static assets not built (python assets/build.py); development fallback -->
             <script src="https://cdn.tailwindcss.com"></script>
-            <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-            <script src="https://unpkg.com/alpinejs" defer></script>
+            <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js"></script>
+            <script src="https://cdn.jsdelivr.net/npm/alpinejs@3.13.5/dist/cdn.min.js" defer></script>
             <link href="https://fonts.googleapis.com/css2?family=Space+Grotesk:wght@300;400;500;600;700&display=swap" rel="stylesheet">
+            {% endif %}
             <style>
                 :root {
                     --primary: #6366f1;
@@ -69,16 +112,23 @@ def home():
             </style>
         </head>
         <body class="min-h-screen">
-            <div x-data="{ 
-                activeTab: 'dashboard',
-                newIdea: { title: '', description: '', status: 'New' },
-                newTransaction: { amount: '', category: 'Personal', description: '' },
-                editingIdea: null
-            }" class="container mx-auto px-4 py-8">
+            <div x-data="osonai()" @scroll.window.throttle.200ms="loadMoreIfNearBottom()" class="container mx-auto px-4 py-8">
                 <!-- Navigation -->
                 <nav class="glass-card rounded-xl mb-8">
                     <div class="flex justify-between items-center p-6">
-                        <h1 class="text-3xl font-bold gradient-text">Osonai</h1>
+                        <div class="flex items-center space-x-4">
+                            <h1 class="text-3xl font-bold gradient-text">Osonai</h1>
+                            <select x-model="ledger" @change="switchLedger()"
+                                class="rounded-lg bg-slate-800 border-slate-700 text-white text-sm">
+                                {% for name in ledger_names %}
+                                <option value="{{ name }}"{% if name == ledger %} selected{% endif %}>{{ name|title }}</option>
+                                {% endfor %}
+                                <option value="">+ New ledger</option>
+                            </select>
+                            <span class="text-sm text-gray-400" x-show="totals" x-text="totals && ('All ledgers: $' + totals.total_balance)"></span>
+                        </div>
+                        <input type="search" x-model="search.query" @input.debounce.200ms="runSearch()" placeholder="Search"
+                            class="rounded-lg bg-slate-800 border-slate-700 text-white text-sm w-64">
                         <div class="space-x-6">
                             <button @click="activeTab = 'dashboard'" 
                                 class="nav-link px-4 py-2 text-lg" 
@@ -104,18 +154,36 @@ def home():
                     <div class="grid grid-cols-1 md:grid-cols-3 gap-6">
                         <div @click="activeTab = 'banking'" class="glass-card p-8 rounded-xl hover-glow transition-all duration-300 cursor-pointer">
                             <h3 class="text-lg font-medium text-gray-400">Total Balance</h3>
-                            <p class="text-4xl font-bold gradient-text mt-2">${{ total_balance }}</p>
+                            <p class="text-4xl font-bold gradient-text mt-2" x-text="'$' + aggregates.total_balance">${{ total_balance }}</p>
+                            <ul class="mt-4 space-y-1 text-sm text-gray-400">
+                                <template x-for="[category, total] in Object.entries(aggregates.category_totals)" :key="category">
+                                <li class="flex justify-between"><span x-text="category"></span><span x-text="'$' + total"></span></li>
+                                </template>
+                            </ul>
                         </div>
                         <div @click="activeTab = 'ideas'" class="glass-card p-8 rounded-xl hover-glow transition-all duration-300 cursor-pointer">
                             <h3 class="text-lg font-medium text-gray-400">Active Ideas</h3>
-                            <p class="text-4xl font-bold text-green-400 mt-2">{{ active_ideas_count }}</p>
+                            <p class="text-4xl font-bold text-green-400 mt-2" x-text="aggregates.active_ideas_count">{{ active_ideas_count }}</p>
+                            <ul class="mt-4 space-y-1 text-sm text-gray-400">
+                                <template x-for="[status, count] in Object.entries(aggregates.status_counts)" :key="status">
+                                <li class="flex justify-between"><span x-text="status"></span><span x-text="count"></span></li>
+                                </template>
+                            </ul>
                         </div>
                         <div @click="activeTab = 'banking'" class="glass-card p-8 rounded-xl hover-glow transition-all duration-300 cursor-pointer">
                             <h3 class="text-lg font-medium text-gray-400">Recent Transactions</h3>
-                            <p class="text-4xl font-bold text-blue-400 mt-2">{{ recent_transactions_count }}</p>
+                            <p class="text-4xl font-bold text-blue-400 mt-2" x-text="aggregates.transaction_count">{{ recent_transactions_count }}</p>
                         </div>
                     </div>
                     <div class="glass-card p-8 rounded-xl">
+                        <div class="flex justify-end space-x-2 mb-4 text-sm">
+                            <template x-for="bucket in ['day', 'week', 'month']" :key="bucket">
+                                <button @click="chartBucket = bucket; updateBalanceChart(bucket)"
+                                    class="px-3 py-1 rounded-full capitalize transition-colors"
+                                    :class="chartBucket === bucket ? 'bg-indigo-500 text-white' : 'text-gray-400 hover:text-white'"
+                                    x-text="bucket"></button>
+                            </template>
+                        </div>
                         <canvas id="financialChart"></canvas>
                     </div>
                 </div>
@@ -123,22 +191,8 @@ def home():
                 <!-- Ideas Tab -->
                 <div x-show="activeTab === 'ideas'" class="space-y-8">
                     <div class="glass-card p-8 rounded-xl">
-                        <h2 class="text-2xl font-bold gradient-text mb-6">New Idea</h2>
-                        <form @submit.prevent="fetch('/add_idea', {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/x-www-form-urlencoded',
-                            },
-                            body: new URLSearchParams({
-                                'title': newIdea.title,
-                                'description': newIdea.description,
-                                'status': newIdea.status
-                            })
-                        }).then(response => {
-                            if (response.ok) {
-                                window.location.reload();
-                            }
-                        })" class="space-y-6">
+                        <h2 class="text-2xl font-bold gradient-text mb-6" x-text="editingIdea === null ? 'New Idea' : 'Edit Idea'">New Idea</h2>
+                        <form @submit.prevent="saveIdea()" class="space-y-6">
                             <div>
                                 <label class="block text-sm font-medium text-gray-400">Title</label>
                                 <input type="text" x-model="newIdea.title" 
@@ -160,68 +214,105 @@ def home():
                                 </select>
                             </div>
                             <button type="submit" 
-                                class="w-full bg-gradient-to-r from-indigo-500 to-purple-500 text-white py-3 px-4 rounded-lg hover:opacity-90 transition-opacity">
+                                class="w-full bg-gradient-to-r from-indigo-500 to-purple-500 text-white py-3 px-4 rounded-lg hover:opacity-90 transition-opacity"
+                                x-text="editingIdea === null ? 'Add Idea' : 'Save Idea'">
                                 Add Idea
                             </button>
+                            <button type="button" x-show="editingIdea !== null" @click="resetIdeaForm()"
+                                class="w-full text-gray-400 hover:text-white py-2 transition-colors">
+                                Cancel
+                            </button>
                         </form>
                     </div>
                     <div class="glass-card p-8 rounded-xl">
-                        <h2 class="text-2xl font-bold gradient-text mb-6">Your Ideas</h2>
+                        <div class="flex justify-between items-center mb-6">
+                            <h2 class="text-2xl font-bold gradient-text">Your Ideas</h2>
+                            <select x-model="ideas.filters.status" @change="reload('ideas')"
+                                class="rounded-lg bg-slate-800 border-slate-700 text-white text-sm">
+                                <option value="">All statuses</option>
+                                {% for status in idea_statuses %}
+                                <option value="{{ status }}">{{ status }}</option>
+                                {% endfor %}
+                            </select>
+                        </div>
                         <div class="space-y-4">
-                            {% for idea in ideas %}
+                            <template x-for="idea in ideas.items" :key="idea.id">
                             <div class="glass-card p-6 rounded-lg hover-glow transition-all duration-300">
                                 <div class="flex justify-between items-start">
-                                    <h3 class="font-semibold text-lg">{{ idea.title }}</h3>
+                                    <h3 class="font-semibold text-lg" x-text="idea.title"></h3>
                                     <span class="px-3 py-1 text-sm rounded-full" :class="{
                                         'bg-green-900/50 text-green-400': idea.status === 'Completed',
                                         'bg-yellow-900/50 text-yellow-400': idea.status === 'In Progress',
                                         'bg-blue-900/50 text-blue-400': idea.status === 'New',
                                         'bg-gray-900/50 text-gray-400': idea.status === 'On Hold'
-                                    }">{{ idea.status }}</span>
+                                    }" x-text="idea.status"></span>
                                 </div>
-                                <p class="text-gray-400 mt-3">{{ idea.description }}</p>
+                                <p class="text-gray-400 mt-3" x-text="idea.description"></p>
                                 <div class="mt-4 flex space-x-4">
-                                    <button @click="editingIdea = {{ loop.index0 }}; newIdea = { title: '{{ idea.title }}', description: '{{ idea.description }}', status: '{{ idea.status }}' }" 
+                                    <button @click="editingIdea = idea.id; newIdea = { title: idea.title, description: idea.description, status: idea.status }" 
                                         class="text-indigo-400 hover:text-indigo-300 transition-colors">Edit</button>
-                                    <button @click="fetch('/delete_idea', {
-                                        method: 'POST',
-                                        headers: {
-                                            'Content-Type': 'application/x-www-form-urlencoded',
-                                        },
-                                        body: new URLSearchParams({
-                                            'index': '{{ loop.index0 }}'
-                                        })
-                                    }).then(response => {
-                                        if (response.ok) {
-                                            window.location.reload();
-                                        }
-                                    })" class="text-red-400 hover:text-red-300 transition-colors">Delete</button>
+                                    <button @click="deleteIdea(idea.id)" class="text-red-400 hover:text-red-300 transition-colors">Delete</button>
                                 </div>
                             </div>
-                            {% endfor %}
+                            </template>
+                            <button x-show="ideas.cursor !== null" @click="loadMore('ideas')"
+                                class="w-full text-gray-400 hover:text-white py-2 transition-colors">Load more</button>
                         </div>
                     </div>
                 </div>
 
+                <!-- Search Results -->
+                <div x-show="activeTab === 'search'" class="space-y-8">
+                    <div class="glass-card p-8 rounded-xl">
+                        <div class="flex flex-wrap gap-2 mb-6 text-sm">
+                            <template x-for="[status, count] in Object.entries(search.facets.status)" :key="'s' + status">
+                                <button @click="search.status = search.status === status ? '' : status; runSearch()"
+                                    class="px-3 py-1 rounded-full transition-colors"
+                                    :class="search.status === status ? 'bg-indigo-500 text-white' : 'bg-slate-800 text-gray-400 hover:text-white'"
+                                    x-text="status + ' (' + count + (search.complete ? '' : '+') + ')'"></button>
+                            </template>
+                            <template x-for="[category, count] in Object.entries(search.facets.category)" :key="'c' + category">
+                                <button @click="search.category = search.category === category ? '' : category; runSearch()"
+                                    class="px-3 py-1 rounded-full transition-colors"
+                                    :class="search.category === category ? 'bg-indigo-500 text-white' : 'bg-slate-800 text-gray-400 hover:text-white'"
+                                    x-text="category + ' (' + count + (search.complete ? '' : '+') + ')'"></button>
+                            </template>
+                        </div>
+                        <h2 class="text-2xl font-bold gradient-text mb-4" x-show="search.ideas.length">Ideas</h2>
+                        <div class="space-y-4 mb-8">
+                            <template x-for="idea in search.ideas" :key="idea.id">
+                            <div class="glass-card p-6 rounded-lg">
+                                <div class="flex justify-between items-start">
+                                    <h3 class="font-semibold text-lg" x-text="idea.title"></h3>
+                                    <span class="px-3 py-1 text-sm rounded-full bg-slate-800 text-gray-400" x-text="idea.status"></span>
+                                </div>
+                                <p class="text-gray-400 mt-3" x-text="idea.description"></p>
+                            </div>
+                            </template>
+                        </div>
+                        <h2 class="text-2xl font-bold gradient-text mb-4" x-show="search.transactions.length">Transactions</h2>
+                        <table class="min-w-full" x-show="search.transactions.length">
+                            <tbody class="divide-y divide-slate-700">
+                                <template x-for="transaction in search.transactions" :key="transaction.id">
+                                <tr>
+                                    <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-400" x-text="transaction.date"></td>
+                                    <td class="px-6 py-4 whitespace-nowrap text-sm" :class="transaction.amount >= 0 ? 'text-green-400' : 'text-red-400'"
+                                        x-text="'$' + transaction.amount"></td>
+                                    <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-400" x-text="transaction.category"></td>
+                                    <td class="px-6 py-4 text-sm text-gray-400" x-text="transaction.description"></td>
+                                </tr>
+                                </template>
+                            </tbody>
+                        </table>
+                        <p class="text-gray-400" x-show="!search.ideas.length && !search.transactions.length">No matches.</p>
+                    </div>
+                </div>
+
                 <!-- Banking Tab -->
                 <div x-show="activeTab === 'banking'" class="space-y-8">
                     <div class="glass-card p-8 rounded-xl">
                         <h2 class="text-2xl font-bold gradient-text mb-6">New Transaction</h2>
-                        <form @submit.prevent="fetch('/add_transaction', {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/x-www-form-urlencoded',
-                            },
-                            body: new URLSearchParams({
-                                'amount': newTransaction.amount,
-                                'category': newTransaction.category,
-                                'description': newTransaction.description
-                            })
-                        }).then(response => {
-                            if (response.ok) {
-                                window.location.reload();
-                            }
-                        })" class="space-y-6">
+                        <form @submit.prevent="addTransaction()" class="space-y-6">
                             <div>
                                 <label class="block text-sm font-medium text-gray-400">Amount</label>
                                 <input type="number" x-model="newTransaction.amount" 
@@ -248,7 +339,35 @@ def home():
                         </form>
                     </div>
                     <div class="glass-card p-8 rounded-xl">
-                        <h2 class="text-2xl font-bold gradient-text mb-6">Transaction History</h2>
+                        <h2 class="text-2xl font-bold gradient-text mb-6">Import &amp; Export</h2>
+                        <form @submit.prevent="importFile($event.target)" class="flex flex-wrap items-center gap-4">
+                            <input type="file" name="file" accept=".csv,.jsonl,.ndjson,.ofx,.qfx" class="text-sm text-gray-400">
+                            <button type="submit" :disabled="importing"
+                                class="bg-gradient-to-r from-indigo-500 to-purple-500 text-white py-2 px-4 rounded-lg hover:opacity-90 transition-opacity">
+                                Import
+                            </button>
+                            <a href="/api/export?format=csv&ledger={{ ledger }}" class="text-indigo-400 hover:text-indigo-300 transition-colors">Export CSV</a>
+                            <a href="/api/export?format=jsonl&ledger={{ ledger }}" class="text-indigo-400 hover:text-indigo-300 transition-colors">Export JSONL</a>
+                        </form>
+                        <p class="mt-4 text-sm text-gray-400" x-show="importResult" x-text="importResult"></p>
+                    </div>
+                    <div class="glass-card p-8 rounded-xl">
+                        <div class="flex justify-between items-center mb-6">
+                            <h2 class="text-2xl font-bold gradient-text">Transaction History</h2>
+                            <div class="flex space-x-2 text-sm">
+                                <input type="date" x-model="transactions.filters.start" @change="reload('transactions')"
+                                    class="rounded-lg bg-slate-800 border-slate-700 text-white text-sm">
+                                <input type="date" x-model="transactions.filters.end" @change="reload('transactions')"
+                                    class="rounded-lg bg-slate-800 border-slate-700 text-white text-sm">
+                                <select x-model="transactions.filters.category" @change="reload('transactions')"
+                                    class="rounded-lg bg-slate-800 border-slate-700 text-white text-sm">
+                                    <option value="">All categories</option>
+                                    {% for category in categories %}
+                                    <option value="{{ category }}">{{ category }}</option>
+                                    {% endfor %}
+                                </select>
+                            </div>
+                        </div>
                         <div class="overflow-x-auto">
                             <table class="min-w-full">
                                 <thead>
@@ -261,48 +380,246 @@ def home():
                                     </tr>
                                 </thead>
                                 <tbody class="divide-y divide-slate-700">
-                                    {% for transaction in transactions %}
+                                    <template x-for="transaction in transactions.items" :key="transaction.id">
                                     <tr class="hover:bg-slate-800/50 transition-colors">
-                                        <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-400">{{ transaction.date }}</td>
-                                        <td class="px-6 py-4 whitespace-nowrap text-sm" :class="transaction.amount >= 0 ? 'text-green-400' : 'text-red-400'">
-                                            ${{ transaction.amount }}
+                                        <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-400" x-text="transaction.date"></td>
+                                        <td class="px-6 py-4 whitespace-nowrap text-sm" :class="transaction.amount >= 0 ? 'text-green-400' : 'text-red-400'"
+                                            x-text="'$' + transaction.amount">
                                         </td>
-                                        <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-400">{{ transaction.category }}</td>
-                                        <td class="px-6 py-4 text-sm text-gray-400">{{ transaction.description }}</td>
+                                        <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-400" x-text="transaction.category"></td>
+                                        <td class="px-6 py-4 text-sm text-gray-400" x-text="transaction.description"></td>
                                         <td class="px-6 py-4 whitespace-nowrap text-sm">
-                                            <button @click="fetch('/delete_transaction', {
-                                                method: 'POST',
-                                                headers: {
-                                                    'Content-Type': 'application/x-www-form-urlencoded',
-                                                },
-                                                body: new URLSearchParams({
-                                                    'index': '{{ loop.index0 }}'
-                                                })
-                                            }).then(response => {
-                                                if (response.ok) {
-                                                    window.location.reload();
-                                                }
-                                            })" class="text-red-400 hover:text-red-300 transition-colors">Delete</button>
+                                            <button @click="deleteTransaction(transaction.id)" class="text-red-400 hover:text-red-300 transition-colors">Delete</button>
                                         </td>
                                     </tr>
-                                    {% endfor %}
+                                    </template>
                                 </tbody>
                             </table>
+                            <button x-show="transactions.cursor !== null" @click="loadMore('transactions')"
+                                class="w-full text-gray-400 hover:text-white py-2 transition-colors">Load more</button>
                         </div>
                     </div>
                 </div>
             </div>
 
+            <script id="initial-data" type="application/json">{{ initial|tojson }}</script>
             <script>
+                // Every request names this page's ledger, so tabs on different ledgers never mix
+                const ledger = JSON.parse(document.getElementById('initial-data').textContent).ledger;
+                function ledgerUrl(path) {
+                    return path + (path.includes('?') ? '&' : '?') + 'ledger=' + encodeURIComponent(ledger);
+                }
+
+                // Lists start with the first server-rendered page; older entries are fetched on scroll
+                function osonai() {
+                    const initial = JSON.parse(document.getElementById('initial-data').textContent);
+                    return {
+                        ledger: ledger,
+                        totals: null,
+                        activeTab: 'dashboard',
+                        newIdea: { title: '', description: '', status: 'New' },
+                        newTransaction: { amount: '', category: 'Personal', description: '' },
+                        editingIdea: null,
+                        chartBucket: 'month',
+                        chartTimer: null,
+                        aggregates: initial.aggregates,
+                        ideas: { items: initial.ideas.items, cursor: initial.ideas.next_cursor, filters: { status: '' }, loading: false },
+                        transactions: { items: initial.transactions.items, cursor: initial.transactions.next_cursor, filters: { category: '', start: '', end: '' }, loading: false },
+                        importing: false,
+                        importResult: '',
+                        search: { query: '', status: '', category: '', ideas: [], transactions: [], facets: { status: {}, category: {} }, complete: true, previousTab: 'dashboard' },
+
+                        init() {
+                            updateBalanceChart(this.chartBucket);
+                            this.connectEvents();
+                        },
+                        switchLedger() {
+                            if (this.ledger) {
+                                window.location.href = '/?ledger=' + encodeURIComponent(this.ledger);
+                                return;
+                            }
+                            const name = (prompt('Name of the new ledger') || '').trim().toLowerCase();
+                            if (!name) {
+                                this.ledger = ledger;
+                                return;
+                            }
+                            this.api('POST', '/api/ledgers', { name: name })
+                                .then(() => { window.location.href = '/?ledger=' + encodeURIComponent(name); })
+                                .catch(response => {
+                                    this.ledger = ledger;
+                                    response.json().then(result => alert(result.error));
+                                });
+                        },
+                        // Changes made anywhere arrive as server-sent events and are applied like API deltas
+                        connectEvents() {
+                            const source = new EventSource(ledgerUrl('/events?since=' + encodeURIComponent(initial.position)));
+                            const on = (name, handler) => source.addEventListener(name, event => handler(JSON.parse(event.data)));
+                            on('idea', record => this.upsert('ideas', record));
+                            on('idea_deleted', record => this.remove('ideas', record.id));
+                            on('transaction', record => { this.upsert('transactions', record); this.chartChanged(); });
+                            on('transaction_deleted', record => { this.remove('transactions', record.id); this.chartChanged(); });
+                            on('aggregates', aggregates => { this.aggregates = aggregates; });
+                            on('totals', totals => { this.totals = totals; });
+                            on('resync', () => this.resync());
+                        },
+                        resync() {
+                            this.reload('ideas');
+                            this.reload('transactions');
+                            fetch(ledgerUrl('/api/aggregates')).then(response => response.json()).then(aggregates => { this.aggregates = aggregates; });
+                            this.chartChanged();
+                        },
+                        chartChanged() {
+                            // Coalesce bursts of events into one chart refresh
+                            clearTimeout(this.chartTimer);
+                            this.chartTimer = setTimeout(() => updateBalanceChart(this.chartBucket), 500);
+                        },
+                        fetchPage(kind, cursor) {
+                            const params = new URLSearchParams();
+                            for (const [key, value] of Object.entries(this[kind].filters)) {
+                                if (value) params.set(key, value);
+                            }
+                            if (cursor !== null) params.set('cursor', cursor);
+                            return fetch(ledgerUrl('/api/' + kind + '?' + params)).then(response => response.json());
+                        },
+                        loadMore(kind) {
+                            const list = this[kind];
+                            if (list.loading || list.cursor === null) return;
+                            list.loading = true;
+                            this.fetchPage(kind, list.cursor).then(page => {
+                                list.items.push(...page.items);
+                                list.cursor = page.next_cursor;
+                            }).finally(() => { list.loading = false; });
+                        },
+                        reload(kind) {
+                            const list = this[kind];
+                            list.loading = true;
+                            this.fetchPage(kind, null).then(page => {
+                                list.items = page.items;
+                                list.cursor = page.next_cursor;
+                            }).finally(() => { list.loading = false; });
+                        },
+                        runSearch() {
+                            const search = this.search;
+                            if (!search.query.trim()) {
+                                if (this.activeTab === 'search') this.activeTab = search.previousTab;
+                                return;
+                            }
+                            if (this.activeTab !== 'search') search.previousTab = this.activeTab;
+                            this.activeTab = 'search';
+                            const params = new URLSearchParams({ q: search.query });
+                            if (search.status) params.set('status', search.status);
+                            if (search.category) params.set('category', search.category);
+                            const query = search.query;
+                            fetch(ledgerUrl('/api/search?' + params)).then(response => response.json()).then(results => {
+                                // Typing may have moved on while this was in flight
+                                if (query !== search.query) return;
+                                search.ideas = results.ideas;
+                                search.transactions = results.transactions;
+                                search.facets = results.facets;
+                                search.complete = results.facets_complete;
+                            });
+                        },
+                        // Mutations go through the JSON API and patch local state from the returned delta
+                        api(method, url, body) {
+                            return fetch(ledgerUrl(url), {
+                                method: method,
+                                headers: { 'Content-Type': 'application/json' },
+                                body: body === undefined ? undefined : JSON.stringify(body)
+                            }).then(response => response.ok ? response.json() : Promise.reject(response));
+                        },
+                        matches(kind, record) {
+                            const filters = this[kind].filters;
+                            const date = (kind === 'ideas' ? record.created_at : record.date) || '';
+                            if (filters.status && record.status !== filters.status) return false;
+                            if (filters.category && record.category !== filters.category) return false;
+                            if (filters.start && date < filters.start) return false;
+                            if (filters.end && date.slice(0, filters.end.length) > filters.end) return false;
+                            return true;
+                        },
+                        upsert(kind, record) {
+                            const items = this[kind].items;
+                            const index = items.findIndex(item => item.id === record.id);
+                            if (index >= 0) {
+                                if (this.matches(kind, record)) items.splice(index, 1, record);
+                                else items.splice(index, 1);
+                            } else if (this.matches(kind, record)) {
+                                // Newest first, so a new record goes on top
+                                items.unshift(record);
+                            }
+                        },
+                        remove(kind, id) {
+                            const list = this[kind];
+                            list.items = list.items.filter(item => item.id !== id);
+                        },
+                        resetIdeaForm() {
+                            this.editingIdea = null;
+                            this.newIdea = { title: '', description: '', status: 'New' };
+                        },
+                        saveIdea() {
+                            const request = this.editingIdea === null
+                                ? this.api('POST', '/api/ideas', this.newIdea)
+                                : this.api('PATCH', '/api/ideas/' + this.editingIdea, this.newIdea);
+                            request.then(delta => {
+                                this.upsert('ideas', delta.record);
+                                this.aggregates = delta.aggregates;
+                                this.resetIdeaForm();
+                            });
+                        },
+                        deleteIdea(id) {
+                            this.api('DELETE', '/api/ideas/' + id).then(delta => {
+                                this.remove('ideas', id);
+                                this.aggregates = delta.aggregates;
+                            });
+                        },
+                        addTransaction() {
+                            this.api('POST', '/api/transactions', this.newTransaction).then(delta => {
+                                this.upsert('transactions', delta.record);
+                                this.aggregates = delta.aggregates;
+                                updateBalanceChart(this.chartBucket);
+                                this.newTransaction = { amount: '', category: this.newTransaction.category, description: '' };
+                            });
+                        },
+                        deleteTransaction(id) {
+                            this.api('DELETE', '/api/transactions/' + id).then(delta => {
+                                this.remove('transactions', id);
+                                this.aggregates = delta.aggregates;
+                                updateBalanceChart(this.chartBucket);
+                            });
+                        },
+                        importFile(form) {
+                            this.importing = true;
+                            this.importResult = 'Importing...';
+                            fetch(ledgerUrl('/api/import'), { method: 'POST', body: new FormData(form) })
+                                .then(response => response.json())
+                                .then(result => {
+                                    this.importResult = result.imported + ' imported, ' + result.duplicates + ' duplicates, '
+                                        + result.rejected + ' rejected (' + result.rows_per_second + ' rows/s)'
+                                        + (result.errors.length ? ': ' + result.errors.join('; ') : '');
+                                    this.aggregates = result.aggregates;
+                                    this.reload('transactions');
+                                    updateBalanceChart(this.chartBucket);
+                                    form.reset();
+                                })
+                                .finally(() => { this.importing = false; });
+                        },
+                        loadMoreIfNearBottom() {
+                            if (window.innerHeight + window.scrollY < document.body.offsetHeight - 400) return;
+                            if (this.activeTab === 'ideas') this.loadMore('ideas');
+                            if (this.activeTab === 'banking') this.loadMore('transactions');
+                        }
+                    };
+                }
+
                 // Initialize Chart.js with custom styling
                 const ctx = document.getElementById('financialChart').getContext('2d');
-                new Chart(ctx, {
+                const categoryColors = ['#8b5cf6', '#ec4899', '#22c55e', '#eab308', '#06b6d4', '#f97316'];
+                const financialChart = new Chart(ctx, {
                     type: 'line',
                     data: {
-                        labels: ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun'],
+                        labels: [],
                         datasets: [{
                             label: 'Balance',
-                            data: [1200, 1900, 3000, 5000, 2000, 3000],
+                            data: [],
                             borderColor: '#6366f1',
                             backgroundColor: 'rgba(99, 102, 241, 0.1)',
                             borderWidth: 2,
@@ -355,49 +672,642 @@ def home():
                         }
                     }
                 });
+
+                // Running balance from the server, already downsampled to a few hundred points
+                function updateBalanceChart(bucket) {
+                    return fetch(ledgerUrl('/api/balance_series?bucket=' + bucket + '&points=300&categories=all'))
+                        .then(response => response.json())
+                        .then(series => {
+                            const hidden = {};
+                            financialChart.data.datasets.slice(1).forEach(dataset => { hidden[dataset.label] = dataset.hidden; });
+                            financialChart.data.labels = series.labels;
+                            financialChart.data.datasets[0].data = series.balance;
+                            financialChart.data.datasets.length = 1;
+                            Object.entries(series.categories).forEach(([category, values], i) => {
+                                financialChart.data.datasets.push({
+                                    label: category,
+                                    data: values,
+                                    borderColor: categoryColors[i % categoryColors.length],
+                                    borderWidth: 1,
+                                    tension: 0.4,
+                                    pointRadius: 0,
+                                    hidden: category in hidden ? hidden[category] : true
+                                });
+                            });
+                            financialChart.update();
+                        });
+                }
             </script>
         </body>
         </html>
-    ''', ideas=ideas, categories=categories, idea_statuses=idea_statuses,
-    total_balance=sum(t.get('amount', 0) for t in transactions),
-    active_ideas_count=len([i for i in ideas if i.get('status') != 'Completed']),
-    recent_transactions_count=len(transactions))
+'''
 
-@app.route("/add_idea", methods=["POST"])
-def add_idea():
-    idea = {
-        'title': request.form.get('title'),
-        'description': request.form.get('description'),
-        'status': request.form.get('status', 'New'),
+# Compiled once at startup instead of on every request
+home_template = app.jinja_env.from_string(HOME_TEMPLATE)
+
+# Content-hashed, precompressed files from `python assets/build.py`. Their
+# names change with their content, so browsers may cache them forever.
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+mimetypes.add_type('font/woff2', '.woff2')
+
+def load_assets():
+    try:
+        with open(os.path.join(STATIC_DIR, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        app.logger.warning('static assets not built, falling back to CDNs; run python assets/build.py')
+        return None, {}
+    encodings = {}
+    for filename in manifest.values():
+        encodings[filename] = [encoding for encoding, suffix in PRECOMPRESSED
+                               if os.path.exists(os.path.join(STATIC_DIR, filename + suffix))]
+    return manifest, encodings
+
+assets, asset_encodings = load_assets()
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def page_json(table, cursor=None, limit=PAGE_SIZE, **filters):
+    items, next_cursor = table.page(cursor, limit, **filters)
+    return {'items': items, 'next_cursor': next_cursor}
+
+def in_date_range(value, start, end):
+    # Dates are ISO-like strings, so prefix comparison orders them correctly;
+    # ``end`` is inclusive at whatever precision it is given in
+    return (not start or value >= start) and (not end or value[:len(end)] <= end)
+
+def page_args():
+    cursor = request.args.get('cursor', type=int)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    return cursor, limit, request.args.get('start'), request.args.get('end')
+
+def api_error(message, status=400):
+    return jsonify(error=message), status
+
+@app.before_request
+def start_timer():
+    # Registered first, so the time spent catching up with the journal counts too
+    g.request_start = time.perf_counter()
+
+# Routes that do not belong to a ledger
+UNLEDGERED = ('static_asset', 'metrics_text', 'api_ledgers', 'api_create_ledger')
+
+@app.before_request
+def sync_store():
+    if request.endpoint in UNLEDGERED:
+        return
+    # Pages name their ledger on every request; the cookie only picks the
+    # one a bare visit to / shows, and falls back to the default once that
+    # ledger is gone, e.g. in a fresh container
+    name = request.args.get('ledger')
+    if not name:
+        name = request.cookies.get('ledger') or DEFAULT_LEDGER
+        if ledgers.get(name) is None:
+            name = DEFAULT_LEDGER
+    g.store = ledgers.get(name)
+    if g.store is None:
+        return api_error('no ledger %r' % name, 404)
+    g.ledger = name
+    # Other worker processes may have committed since this one last looked
+    g.store.refresh()
+
+@app.after_request
+def record_status(response):
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request(exc):
+    start = g.pop('request_start', None)
+    if start is None:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe('osonai_request_seconds', time.perf_counter() - start, (('route', route), ('method', request.method)))
+    metrics.inc('osonai_requests_total', (('route', route), ('method', request.method), ('status', str(g.get('status', 500)))))
+    update_gauges()
+
+def update_gauges():
+    if g.get('store') is not None:
+        aggregates = g.store.aggregates
+        metrics.set('osonai_transactions', aggregates.transaction_count, (('ledger', g.ledger),))
+        metrics.set('osonai_ideas', aggregates.idea_count, (('ledger', g.ledger),))
+    # ru_maxrss is in kilobytes on Linux
+    metrics.set('osonai_max_rss_bytes', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+# The rendered dashboard is cached per ledger and store version, which every
+# mutation bumps, and the ledger list the switcher shows
+page_caches = {}
+page_cache_lock = threading.Lock()
+
+def render_home():
+    names = ledgers.names()
+    with page_cache_lock:
+        page_cache = page_caches.setdefault(g.ledger, {'version': None, 'body': None, 'etag': None})
+        if page_cache['version'] == (store.version, names):
+            metrics.inc('osonai_home_cache_total', (('result', 'hit'),))
+            return page_cache['body'], page_cache['etag']
+        version = store.version, names
+    metrics.inc('osonai_home_cache_total', (('result', 'miss'),))
+    aggregates = store.aggregates
+    with metrics.time('osonai_home_aggregate_seconds'), store.lock:
+        initial = {
+            'ideas': page_json(store.ideas),
+            'transactions': page_json(store.transactions),
+            'aggregates': aggregates.to_dict(),
+            'position': event_id(store.position()),
+            'ledger': g.ledger,
+        }
+    with metrics.time('osonai_home_render_seconds'):
+        body = render_template(home_template, initial=initial, assets=assets,
+            ledger=g.ledger, ledger_names=names,
+            categories=categories, idea_statuses=idea_statuses,
+            total_balance=aggregates.balance,
+            active_ideas_count=aggregates.active_ideas_count,
+            recent_transactions_count=aggregates.transaction_count,
+            category_totals=aggregates.category_totals,
+            status_counts=aggregates.status_counts)
+    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+    with page_cache_lock:
+        # A write may have landed while rendering; only cache if still current
+        if (store.version, names) == version:
+            page_cache.update(version=version, body=body, etag=etag)
+    return body, etag
+
+@app.route("/")
+def home():
+    body, etag = render_home()
+    response = make_response(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Remembers a ledger picked by name, and replaces a stale cookie
+    if request.args.get('ledger') or request.cookies.get('ledger', g.ledger) != g.ledger:
+        response.set_cookie('ledger', g.ledger, max_age=365 * 24 * 3600, samesite='Lax')
+    return response.make_conditional(request)
+
+@app.route("/static/<path:filename>")
+def static_asset(filename):
+    # Only files from the manifest, so unhashed names never get an immutable header
+    encodings = asset_encodings.get(filename)
+    if encodings is None:
+        abort(404)
+    encoding = request.accept_encodings.best_match(encodings + ['identity'])
+    path = filename if encoding in (None, 'identity') else filename + dict(PRECOMPRESSED)[encoding]
+    response = send_from_directory(STATIC_DIR, path, mimetype=mimetypes.guess_type(filename)[0])
+    if path != filename:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+@app.route("/api/ideas")
+def api_ideas():
+    cursor, limit, start, end = page_args()
+    try:
+        period_bounds(start, end)
+    except ValueError:
+        return api_error('start and end must be dates like 2024, 2024-05 or 2024-05-31')
+    status = request.args.get('status')
+    match = None
+    if status or start or end:
+        def match(idea):
+            return (not status or idea.get('status') == status) and in_date_range(idea.get('created_at') or '', start, end)
+    with store.lock:
+        return jsonify(page_json(store.ideas, cursor, limit, match=match))
+
+@app.route("/api/transactions")
+def api_transactions():
+    cursor, limit, start, end = page_args()
+    category = request.args.get('category') or None
+    try:
+        with store.lock:
+            return jsonify(page_json(store.transactions, cursor, limit, category=category, start=start, end=end))
+    except ValueError:
+        return api_error('start and end must be dates like 2024, 2024-05 or 2024-05-31')
+
+def text_field(data, field):
+    value = data.get(field)
+    if value is not None and not isinstance(value, str):
+        raise ValueError('%s must be a string' % field)
+    return value
+
+def choice_field(value, field, choices):
+    if value not in choices:
+        raise ValueError('%s must be one of %s' % (field, ', '.join(choices)))
+    return value
+
+def amount_field(data):
+    value = data.get('amount') or 0
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError('amount must be a number')
+    try:
+        amount = float(value)
+    except (ValueError, OverflowError):
+        raise ValueError('amount must be a number')
+    if not valid_amount(amount):
+        raise ValueError('amount must be finite and at most %d' % MAX_AMOUNT)
+    return amount
+
+def new_idea(data):
+    return {
+        'title': text_field(data, 'title'),
+        'description': text_field(data, 'description'),
+        'status': choice_field(data.get('status') or 'New', 'status', idea_statuses),
         'created_at': datetime.now().isoformat()
     }
-    ideas.append(idea)
+
+def new_transaction(data):
+    return {
+        'amount': amount_field(data),
+        'category': choice_field(data.get('category') or categories[0], 'category', categories),
+        'description': text_field(data, 'description'),
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M')
+    }
+
+def idea_changes(data):
+    changes = {field: text_field(data, field) for field in ('title', 'description') if field in data}
+    if 'status' in data:
+        changes['status'] = choice_field(data['status'], 'status', idea_statuses)
+    return changes
+
+@app.route("/add_idea", methods=["POST"])
+def add_idea():
+    try:
+        idea = new_idea(request.form)
+    except ValueError as e:
+        return api_error(str(e))
+    store.add_idea(idea)
     return redirect("/")
 
 @app.route("/add_transaction", methods=["POST"])
 def add_transaction():
-    transaction = {
-        'amount': float(request.form.get('amount', 0)),
-        'category': request.form.get('category'),
-        'description': request.form.get('description'),
-        'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-    }
-    transactions.append(transaction)
+    try:
+        transaction = new_transaction(request.form)
+    except ValueError as e:
+        return api_error(str(e))
+    store.add_transaction(transaction)
+    return redirect("/")
+
+@app.route("/update_idea", methods=["POST"])
+def update_idea():
+    idea_id = request.form.get('id', type=int)
+    if idea_id is None:
+        return api_error('id must be a number')
+    try:
+        changes = idea_changes(request.form)
+    except ValueError as e:
+        return api_error(str(e))
+    store.update_idea(idea_id, changes)
     return redirect("/")
 
 @app.route("/delete_idea", methods=["POST"])
 def delete_idea():
-    index = int(request.form.get('index'))
-    if 0 <= index < len(ideas):
-        ideas.pop(index)
+    idea_id = request.form.get('id', type=int)
+    if idea_id is None:
+        return api_error('id must be a number')
+    store.delete_idea(idea_id)
     return redirect("/")
 
 @app.route("/delete_transaction", methods=["POST"])
 def delete_transaction():
-    index = int(request.form.get('index'))
-    if 0 <= index < len(transactions):
-        transactions.pop(index)
+    transaction_id = request.form.get('id', type=int)
+    if transaction_id is None:
+        return api_error('id must be a number')
+    store.delete_transaction(transaction_id)
     return redirect("/")
 
+@app.route("/api/balance_series")
+def api_balance_series():
+    bucket = request.args.get('bucket', 'month')
+    if bucket not in BUCKETS:
+        return api_error('bucket must be one of %s' % ', '.join(BUCKETS))
+    points = request.args.get('points', 300, type=int)
+    if request.args.get('categories') == 'all':
+        wanted = categories
+    else:
+        wanted = request.args.getlist('category')
+    with store.lock:
+        return jsonify(store.series.query(bucket, max(points, 3), wanted))
+
+MAX_REPORT_TOP = 100
+
+@app.route("/api/reports")
+def api_reports():
+    top = min(max(request.args.get('top', 10, type=int), 1), MAX_REPORT_TOP)
+    try:
+        with store.lock:
+            report = store.reports.report(request.args.get('start'), request.args.get('end'),
+                                          request.args.get('category') or None, top)
+    except ValueError:
+        return api_error('start and end must be dates like 2024, 2024-05 or 2024-05-31')
+    return jsonify(report)
+
+@app.route("/api/search")
+def api_search():
+    query = request.args.get('q', '')
+    if not tokenize(query):
+        return api_error('q must contain at least one word')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PAGE_SIZE)
+    with store.lock:
+        idea_ids, transaction_ids, facets, complete = store.search.search(
+            query, request.args.get('status') or None, request.args.get('category') or None, limit)
+        return jsonify(
+            ideas=[store.ideas.get(idea_id) for idea_id in idea_ids],
+            transactions=[store.transactions.get(transaction_id) for transaction_id in transaction_ids],
+            facets=facets, facets_complete=complete)
+
+# JSON mutations: each returns the affected record and the new aggregates so
+# the page can patch itself instead of reloading
+
+MAX_BATCH = 1000
+
+def delta(record, status=200):
+    if record is None:
+        return api_error('not found', 404)
+    with store.lock:
+        return jsonify(record=record, aggregates=store.aggregates.to_dict()), status
+
+def json_body():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError('expected a JSON object')
+    return data
+
+def parse_op(raw):
+    kind = raw.get('op')
+    if kind == 'add_idea':
+        return {'op': kind, 'record': new_idea(raw.get('record') or {})}
+    if kind == 'add_transaction':
+        return {'op': kind, 'record': new_transaction(raw.get('record') or {})}
+    if kind == 'update_idea':
+        return {'op': kind, 'id': int(raw['id']), 'changes': idea_changes(raw.get('changes') or {})}
+    if kind in ('delete_idea', 'delete_transaction'):
+        return {'op': kind, 'id': int(raw['id'])}
+    raise ValueError('unknown op %r' % (kind,))
+
+@app.route("/api/ideas", methods=["POST"])
+def api_add_idea():
+    try:
+        idea = new_idea(json_body())
+    except ValueError as e:
+        return api_error(str(e))
+    return delta(store.add_idea(idea), 201)
+
+@app.route("/api/ideas/<int:idea_id>", methods=["PATCH"])
+def api_update_idea(idea_id):
+    try:
+        changes = idea_changes(json_body())
+    except ValueError as e:
+        return api_error(str(e))
+    return delta(store.update_idea(idea_id, changes))
+
+@app.route("/api/ideas/<int:idea_id>", methods=["DELETE"])
+def api_delete_idea(idea_id):
+    return delta(store.delete_idea(idea_id))
+
+@app.route("/api/transactions", methods=["POST"])
+def api_add_transaction():
+    try:
+        transaction = new_transaction(json_body())
+    except ValueError as e:
+        return api_error(str(e))
+    return delta(store.add_transaction(transaction), 201)
+
+@app.route("/api/transactions/<int:transaction_id>", methods=["DELETE"])
+def api_delete_transaction(transaction_id):
+    return delta(store.delete_transaction(transaction_id))
+
+@app.route("/api/batch", methods=["POST"])
+def api_batch():
+    # Applies {"ops": [...]} in order. Every op is validated before any is
+    # applied, so a malformed batch changes nothing; no-op entries yield null.
+    try:
+        raw_ops = json_body().get('ops')
+        if not isinstance(raw_ops, list) or len(raw_ops) > MAX_BATCH:
+            raise ValueError('ops must be a list of at most %d operations' % MAX_BATCH)
+        ops = [parse_op(raw) for raw in raw_ops]
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        return api_error('invalid batch: %s' % e)
+    results = store.commit_many(ops)
+    with store.lock:
+        return jsonify(results=results, aggregates=store.aggregates.to_dict())
+
+# Live updates. Every commit, and every catch-up with the other workers, is
+# pushed to the open dashboards as server-sent events. Event ids are journal
+# positions, so they mean the same in every worker and a reconnecting client
+# is told to resync only if it actually missed something.
+
+MAX_EVENT_BATCH = 100
+EVENT_HEARTBEAT = 15
+EVENT_POLL_INTERVAL = 0.25
+
+broadcasters = {}
+follower = None
+follower_lock = threading.Lock()
+
+def event_id(position):
+    return '%d:%d' % position
+
+def change_event(op, record):
+    kind = op['op']
+    if kind in ('add_idea', 'update_idea'):
+        return 'idea', record
+    if kind == 'add_transaction':
+        return 'transaction', record
+    return kind.replace('delete_', '') + '_deleted', {'id': record['id']}
+
+def broadcast_changes(name, ledger_store, changes):
+    # Called by the store under its lock, so events go out in commit order
+    broadcaster = broadcasters[name]
+    if not broadcaster:
+        return
+    if changes is None or len(changes) > MAX_EVENT_BATCH:
+        events = [(RESYNC, {})]
+    else:
+        events = [change_event(op, record) for op, record in changes]
+    events.append(('aggregates', ledger_store.aggregates.to_dict()))
+    broadcaster.publish(events, event_id(ledger_store.position()))
+
+def watch_ledger(name, ledger_store):
+    broadcasters[name] = Broadcaster()
+    ledger_store.on_change = lambda changes: broadcast_changes(name, ledger_store, changes)
+
+ledgers.on_open = watch_ledger
+# Load the default ledger at startup rather than on the first request
+ledgers.get(DEFAULT_LEDGER)
+
+def follow_other_workers():
+    # Commits from other worker processes only show up here on refresh
+    totals_version = None
+    while True:
+        time.sleep(EVENT_POLL_INTERVAL)
+        for name, ledger_store in ledgers.items():
+            if broadcasters[name]:
+                ledger_store.refresh()
+        totals_version = publish_totals(totals_version)
+
+def publish_totals(last_version):
+    # The totals over all ledgers go to every open dashboard, whatever its
+    # ledger; read once per worker from the ledgers' summaries, and only
+    # sent when they changed
+    watching = [broadcaster for broadcaster in list(broadcasters.values()) if broadcaster]
+    if not watching:
+        return last_version
+    version, totals = ledgers.totals()
+    if version != last_version:
+        for broadcaster in watching:
+            broadcaster.publish([('totals', totals)])
+    return version
+
+def start_follower():
+    global follower
+    with follower_lock:
+        if follower is None:
+            follower = threading.Thread(target=follow_other_workers, name='event-follower', daemon=True)
+            follower.start()
+
+@app.route("/events")
+def events():
+    start_follower()
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    with store.lock:
+        subscription = broadcasters[g.ledger].subscribe()
+        current = event_id(store.position())
+    _, totals = ledgers.totals()
+
+    def stream():
+        try:
+            # Sets the id the browser reconnects with, without an event
+            yield 'retry: 2000\nid: %s\n\n' % current
+            yield format_event('totals', totals)
+            if since != current:
+                yield format_event(RESYNC, {}, current)
+            while True:
+                yield subscription.get(EVENT_HEARTBEAT) or ': keepalive\n\n'
+        finally:
+            subscription.close()
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route("/api/aggregates")
+def api_aggregates():
+    with store.lock:
+        return jsonify(store.aggregates.to_dict())
+
+# Bulk transfer. Imports are parsed a row at a time and committed in batches
+# of MAX_BATCH, skipping rows already stored with the same date, amount and
+# description; exports stream one page of rows at a time.
+
+MAX_IMPORT_ERRORS = 20
+EXPORT_PAGE = 1000
+
+@app.route("/api/import", methods=["POST"])
+def api_import():
+    # Either a multipart upload in "file" or the raw request body
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or detect_format(upload.filename if upload else None, request.content_type)
+    if fmt not in READERS:
+        return api_error('format must be one of %s' % ', '.join(READERS))
+    mapping = {field: request.args[field + '_column'] for field in FIELDS if request.args.get(field + '_column')}
+    try:
+        normalize = Normalizer(categories, request.args.get('category'), request.args.get('date_format'),
+                               request.args.get('decimal') or '.')
+    except ValueError as e:
+        return api_error(str(e))
+    rows = text_stream(upload.stream if upload else request.stream)
+    counts = {'rows': 0, 'imported': 0, 'duplicates': 0, 'rejected': 0}
+    errors = []
+    batch = []
+
+    def commit_batch():
+        added = sum(record is not None for record in store.import_transactions(batch))
+        counts['imported'] += added
+        counts['duplicates'] += len(batch) - added
+        del batch[:]
+        # Let other requests run between batches, greenlets included
+        time.sleep(0)
+
+    started = time.perf_counter()
+    try:
+        for line, fields in READERS[fmt](rows, mapping):
+            counts['rows'] += 1
+            try:
+                batch.append(normalize(fields))
+            except RowError as e:
+                counts['rejected'] += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append('line %d: %s' % (line, e))
+                continue
+            if len(batch) == MAX_BATCH:
+                commit_batch()
+        if batch:
+            commit_batch()
+        status = 200
+    except (ValueError, csv.Error) as e:
+        # Unreadable file; earlier batches stay committed
+        errors.append(str(e))
+        status = 400
+    elapsed = time.perf_counter() - started
+    with store.lock:
+        aggregates = store.aggregates.to_dict()
+    return jsonify(dict(counts, errors=errors, seconds=round(elapsed, 3),
+                        rows_per_second=round(counts['rows'] / elapsed) if elapsed else None,
+                        aggregates=aggregates)), status
+
+@app.route("/api/export")
+def api_export():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORTERS:
+        return api_error('format must be one of %s' % ', '.join(EXPORTERS))
+    category = request.args.get('category') or None
+    start, end = request.args.get('start'), request.args.get('end')
+    try:
+        period_bounds(start, end)
+    except ValueError:
+        return api_error('start and end must be dates like 2024, 2024-05 or 2024-05-31')
+
+    # The stream outlives the request context, and with it the store proxy
+    ledger_store = g.store
+
+    def pages():
+        # The lock is only held per page, so writers are never stalled by a slow download
+        cursor = None
+        while True:
+            with ledger_store.lock:
+                items, cursor = ledger_store.transactions.page(cursor, EXPORT_PAGE, category=category, start=start, end=end)
+            if items:
+                yield items
+            if cursor is None:
+                return
+
+    response = Response(EXPORTERS[fmt](pages()), mimetype=EXPORT_TYPES[fmt])
+    response.headers['Content-Disposition'] = 'attachment; filename=%s-transactions.%s' % (g.ledger, fmt)
+    return response
+
+@app.route("/api/ledgers")
+def api_ledgers():
+    summaries, totals = ledgers.summaries()
+    return jsonify(ledgers=[dict(summaries[name], name=name) for name in summaries], totals=totals)
+
+@app.route("/api/ledgers", methods=["POST"])
+def api_create_ledger():
+    try:
+        created = ledgers.create(str(json_body().get('name', '')).strip().lower())
+    except ValueError as e:
+        return api_error(str(e))
+    if not created:
+        return api_error('ledger exists already', 409)
+    return api_ledgers(), 201
+
+@app.route("/metrics")
+def metrics_text():
+    update_gauges()
+    metrics.flush()
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=3000, debug=False)
@@ -0,0 +1,121 @@
+"""Build the self-hosted static assets into ``static/``.
+
+Vendors the pinned Chart.js, Alpine.js and Space Grotesk font, compiles
+``app.css`` with the Tailwind standalone CLI, purged down to the classes the
+home template uses, and writes every file under a content-hashed name with
+gzip (and, if the ``brotli`` module is installed, brotli) variants next to
+it. ``static/manifest.json`` maps logical names to the hashed ones.
+
+Downloads are cached in ``assets/vendor/``, so only the first build needs
+the network.
+
+    python assets/build.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import urllib.request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SOURCE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(SOURCE)
+VENDOR = os.path.join(SOURCE, 'vendor')
+STATIC = os.path.join(ROOT, 'static')
+
+DOWNLOADS = {
+    'chart.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+    'alpine.js': 'https://cdn.jsdelivr.net/npm/alpinejs@3.13.5/dist/cdn.min.js',
+    'space-grotesk.woff2': 'https://cdn.jsdelivr.net/npm/@fontsource-variable/space-grotesk@5.0.18/files/space-grotesk-latin-wght-normal.woff2',
+}
+
+TAILWIND_VERSION = '3.4.1'
+TAILWIND_URL = 'https://github.com/tailwindlabs/tailwindcss/releases/download/v%s/tailwindcss-linux-%s'
+
+# Fonts are compressed already
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg')
+
+
+def fetch(name, url):
+    path = os.path.join(VENDOR, name)
+    if not os.path.exists(path):
+        print('downloading %s' % url)
+        os.makedirs(VENDOR, exist_ok=True)
+        with urllib.request.urlopen(url) as response, open(path + '.part', 'wb') as f:
+            shutil.copyfileobj(response, f)
+        os.replace(path + '.part', path)
+    return path
+
+
+def tailwind_cli():
+    cli = os.environ.get('TAILWINDCSS') or shutil.which('tailwindcss')
+    if cli:
+        return cli
+    if not sys.platform.startswith('linux'):
+        sys.exit('install the Tailwind CLI (https://tailwindcss.com/blog/standalone-cli) '
+                 'or point TAILWINDCSS at it')
+    arch = 'arm64' if platform.machine() in ('aarch64', 'arm64') else 'x64'
+    cli = fetch('tailwindcss-%s-%s' % (TAILWIND_VERSION, arch), TAILWIND_URL % (TAILWIND_VERSION, arch))
+    os.chmod(cli, 0o755)
+    return cli
+
+
+def build_css():
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'app.css')
+        subprocess.run(
+            [tailwind_cli(), '--config', os.path.join(SOURCE, 'tailwind.config.js'),
+             '--input', os.path.join(SOURCE, 'app.css'), '--output', output, '--minify'],
+            cwd=ROOT, check=True)
+        with open(output, 'rb') as f:
+            return f.read()
+
+
+def publish(name, data, manifest):
+    stem, ext = os.path.splitext(name)
+    hashed = '%s.%s%s' % (stem, hashlib.sha256(data).hexdigest()[:12], ext)
+    path = os.path.join(STATIC, hashed)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if ext in COMPRESSIBLE:
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+    manifest[name] = hashed
+    return hashed
+
+
+def main():
+    if os.path.isdir(STATIC):
+        shutil.rmtree(STATIC)
+    os.makedirs(STATIC)
+    manifest = {}
+    for name, url in DOWNLOADS.items():
+        with open(fetch(name, url), 'rb') as f:
+            publish(name, f.read(), manifest)
+    # The stylesheet refers to the font by its logical name
+    font = manifest['space-grotesk.woff2'].encode()
+    css = re.sub(rb'url\(["\']?space-grotesk\.woff2["\']?\)', b'url(' + font + b')', build_css())
+    publish('app.css', css, manifest)
+    with open(os.path.join(STATIC, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        print('brotli is not installed; wrote gzip variants only')
+    for name, hashed in sorted(manifest.items()):
+        print('%-22s -> static/%s' % (name, hashed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+// Only the classes that appear in the inline home template end up in the CSS
+module.exports = {
+  content: ['./app.py'],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
@@ -0,0 +1,78 @@
+"""Columnar transaction store versus one dict per transaction.
+
+Reports memory held by each representation (tracemalloc) and the time of a
+per-category sum and a date-range sum over both.
+
+    python benchmarks/bench_columns.py [--records 1000000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from columns import TransactionColumns, period_bounds  # noqa: E402
+
+CATEGORIES = ["Personal", "Business", "Investment", "Savings"]
+DESCRIPTIONS = ['Groceries', 'Rent', 'Salary', 'Coffee', 'Fuel', 'Dividends', 'Transfer to savings']
+
+
+def records(count):
+    rng = random.Random(42)
+    start = time.mktime((2015, 1, 1, 0, 0, 0, 0, 0, -1))
+    step = (10 * 365 * 86400) / count
+    for i in range(count):
+        yield {
+            'id': i + 1,
+            'amount': rng.randint(-50000, 60000) / 100,
+            'category': CATEGORIES[i % 4],
+            'description': '%s #%d' % (rng.choice(DESCRIPTIONS), i),
+            'date': time.strftime('%Y-%m-%d %H:%M', time.localtime(start + i * step)),
+        }
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def timed(label, func, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print('  %-34s %8.1f ms  (%s)' % (label, elapsed * 1000, result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=1000000)
+    args = parser.parse_args()
+
+    dicts, dict_bytes = measure(lambda: list(records(args.records)))
+    columns, column_bytes = measure(lambda: TransactionColumns(CATEGORIES, dicts))
+    print('%d transactions' % args.records)
+    print('  list of dicts    %8.1f MB  (%d bytes/row)' % (dict_bytes / 1e6, dict_bytes / args.records))
+    print('  columns          %8.1f MB  (%d bytes/row)' % (column_bytes / 1e6, column_bytes / args.records))
+    print('  reduction        %8.1fx' % (dict_bytes / column_bytes))
+
+    low, high = period_bounds('2019-03', '2021-08')
+    start, end = '2019-03', '2021-08'
+    timed('sum Business, dicts', lambda: round(sum(t['amount'] for t in dicts if t['category'] == 'Business'), 2))
+    timed('sum Business, columns', lambda: columns.sum_cents('Business') / 100)
+    timed('sum 2019-03..2021-08, dicts', lambda: round(sum(
+        t['amount'] for t in dicts if start <= t['date'] and t['date'][:7] <= end), 2))
+    timed('sum 2019-03..2021-08, columns', lambda: columns.sum_cents(low=low, high=high) / 100)
+
+
+if __name__ == '__main__':
+    main()
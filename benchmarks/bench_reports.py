@@ -0,0 +1,118 @@
+"""Reports benchmark: date-range reports against a scan of every row.
+
+Loads synthetic transactions spread over ten years, partly out of date
+order, into an in-memory store. Times building the month rollups in one
+pass, as a load without them in the snapshot does, and restoring them from
+snapshot state; then random ranges, and ranges right after a write, which
+patches only the touched month. Spot checks the totals against a plain
+scan.
+
+    python benchmarks/bench_reports.py [--transactions 1000000] [--queries 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from reports import Reports  # noqa: E402
+from storage import encode  # noqa: E402
+from store import Store  # noqa: E402
+
+CATEGORIES = ["Personal", "Business", "Investment", "Savings"]
+IDEA_STATUSES = ["New", "In Progress", "Completed", "On Hold"]
+PAYEES = ['Coffee House', 'Grocer', 'Landlord', 'Employer', 'Airline', 'Book Shop', 'Gym', 'Pharmacy']
+
+
+def generate(count, seed=1):
+    rng = random.Random(seed)
+    first = date(2015, 1, 1).toordinal()
+    span = date(2025, 1, 1).toordinal() - first
+    transactions = []
+    for i in range(1, count + 1):
+        # Mostly in date order, with one in twenty backdated
+        day = first + (i * span // count if rng.random() > 0.05 else rng.randrange(span))
+        transactions.append({'id': i, 'amount': rng.randint(-20000, 15000) / 100, 'category': rng.choice(CATEGORIES),
+                             'description': '%s #%d' % (rng.choice(PAYEES), i),
+                             'date': '%s %02d:%02d' % (date.fromordinal(day).isoformat(), rng.randint(0, 23),
+                                                       rng.randint(0, 59))})
+    return transactions
+
+
+def random_range(rng):
+    first = date(2015, 1, 1).toordinal()
+    a, b = sorted(rng.randrange(first, date(2025, 1, 1).toordinal()) for _ in range(2))
+    return date.fromordinal(a).isoformat(), date.fromordinal(b).isoformat()
+
+
+def scan(store, start, end, category=None):
+    net = count = 0
+    for row in store.transactions:
+        if start <= row['date'][:10] <= end and (category is None or row['category'] == category):
+            net += round(row['amount'] * 100)
+            count += 1
+    return net / 100, count
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, len(samples) * 99 // 100)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(2)
+
+    store = Store(CATEGORIES, IDEA_STATUSES)
+    store._reset(transactions=generate(args.transactions))
+    reports = store.reports
+
+    _, elapsed = timed(Reports.build, store.transactions)
+    print('build rollups in one pass:   %8.1f ms' % elapsed)
+    encode_rollups, elapsed = timed(reports.freeze)
+    print('freeze, under the lock:      %8.1f ms' % elapsed)
+    state, elapsed = timed(encode_rollups)
+    print('encode, snapshot thread:     %8.1f ms' % elapsed)
+    state = json.loads(json.dumps(state, default=encode))
+    _, elapsed = timed(Reports.thaw, store.transactions, state)
+    print('restore from snapshot:       %8.1f ms' % elapsed)
+
+    warm = []
+    for i in range(args.queries):
+        start, end = random_range(rng)
+        _, elapsed = timed(reports.report, start, end, CATEGORIES[i % 5] if i % 5 < 4 else None)
+        warm.append(elapsed)
+    print('random ranges:              p50 %6.2f ms   p99 %6.2f ms' % percentiles(warm))
+
+    after_write = []
+    for i in range(args.queries // 4):
+        day = date.fromordinal(rng.randrange(date(2015, 1, 1).toordinal(), date(2025, 1, 1).toordinal()))
+        store.add_transaction({'amount': -12.5, 'category': 'Personal', 'description': 'Coffee House',
+                               'date': day.isoformat() + ' 12:00'})
+        _, elapsed = timed(reports.report, *random_range(rng))
+        after_write.append(elapsed)
+    print('random ranges, after write:  p50 %6.2f ms   p99 %6.2f ms' % percentiles(after_write))
+
+    for start, end, category in [random_range(rng) + (None,), random_range(rng) + ('Business',)]:
+        report = reports.report(start, end, category)
+        expected = scan(store, start, end, category)
+        assert (round(report['net'], 2), report['count']) == expected, (report['net'], report['count'], expected)
+    _, elapsed = timed(scan, store, '2015-01-01', '2024-12-31')
+    print('plain scan of every row:     %8.1f ms' % elapsed)
+
+
+if __name__ == '__main__':
+    main()
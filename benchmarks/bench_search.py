@@ -0,0 +1,125 @@
+"""Search benchmark: inverted index against a naive substring scan.
+
+Indexes a mix of ideas and transactions with descriptions drawn from a
+small vocabulary plus unique reference numbers, then times the same
+queries through the index and through a scan of every record, from narrow
+ones to the one-letter and common prefixes the search box sends while a
+word is being typed. Also reports the memory the index takes, next to the
+transaction columns it covers.
+
+    python benchmarks/bench_search.py [--documents 100000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from columns import TransactionColumns  # noqa: E402
+from search import SearchIndex  # noqa: E402
+from storage import encode  # noqa: E402
+
+CATEGORIES = ["Personal", "Business", "Investment", "Savings"]
+IDEA_STATUSES = ["New", "In Progress", "Completed", "On Hold"]
+WORDS = ('coffee groceries rent salary invoice refund subscription travel train hotel dinner lunch '
+         'insurance dividend transfer savings bonus gym books software hosting laptop phone taxi '
+         'market plan launch prototype research feedback design pricing hiring roadmap newsletter').split()
+
+QUERIES = [
+    ('one word', 'coffee', {}),
+    ('prefix', 'sub', {}),
+    ('two words', 'hotel travel', {}),
+    ('two prefixes', 'inv ref', {}),
+    ('rare', 'ref-4242', {}),
+    ('number prefix', '424', {}),
+    ('facet', 'rent', {'category': 'Business'}),
+    ('no match', 'zebra', {}),
+    ('common', 'ref', {}),
+    ('typing', 're', {}),
+    ('one letter', 'r', {}),
+    ('rare facet', 'r', {'status': 'On Hold'}),
+]
+
+
+def generate(count, seed=1):
+    rng = random.Random(seed)
+    ideas = []
+    transactions = []
+    for i in range(1, count + 1):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+        if i % 10 == 0:
+            ideas.append({'id': i, 'title': text.split(' ', 1)[0].title(), 'description': text,
+                          'status': rng.choice(IDEA_STATUSES)})
+        else:
+            transactions.append({'id': i, 'amount': rng.randint(-50000, 50000) / 100,
+                                 'category': rng.choice(CATEGORIES), 'description': '%s ref-%d' % (text, i),
+                                 'date': '2024-%02d-%02d 12:00' % (rng.randint(1, 12), rng.randint(1, 28))})
+    return ideas, transactions
+
+
+def naive(ideas, transactions, query, status=None, category=None, limit=20):
+    words = query.lower().split()
+    found_ideas = [idea['id'] for idea in ideas
+                   if (status is None or idea['status'] == status) and category is None
+                   and all(w in ('%s %s' % (idea['title'], idea['description'])).lower() for w in words)]
+    found_transactions = [t['id'] for t in transactions
+                          if (category is None or t['category'] == category) and status is None
+                          and all(w in t['description'].lower() for w in words)]
+    return sorted(found_ideas)[-limit:], sorted(found_transactions)[-limit:]
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    ideas, transactions = generate(args.documents)
+    tracemalloc.start()
+    columns = TransactionColumns(CATEGORIES, transactions)
+    columns_bytes = tracemalloc.get_traced_memory()[0]
+    index = SearchIndex.build(ideas, columns)
+    index.search('warm up')
+    index_bytes = tracemalloc.get_traced_memory()[0] - columns_bytes
+    del index
+    tracemalloc.stop()
+    print('index memory            %8.1f MiB (transaction columns %.1f MiB)'
+          % (index_bytes / 2 ** 20, columns_bytes / 2 ** 20))
+
+    start = time.perf_counter()
+    index = SearchIndex.build(ideas, columns)
+    index.search('warm up')
+    print('build %d documents      %8.0f ms' % (len(index), (time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    encode_index = index.freeze()
+    print('freeze, under the lock  %8.1f ms' % ((time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    frozen = encode_index()
+    print('encode, snapshot thread %8.1f ms' % ((time.perf_counter() - start) * 1000))
+    frozen = json.loads(json.dumps(frozen, default=encode))
+    start = time.perf_counter()
+    SearchIndex.thaw(frozen).search('warm up')
+    print('load from snapshot      %8.0f ms' % ((time.perf_counter() - start) * 1000))
+    print()
+    print('%-14s %-14s %10s %10s %8s' % ('query', 'q', 'index ms', 'scan ms', 'counted'))
+    for name, query, filters in QUERIES:
+        index_ms, (idea_ids, transaction_ids, facets, complete) = timed(
+            lambda: index.search(query, **filters), args.repeat)
+        scan_ms, _ = timed(lambda: naive(ideas, transactions, query, **filters), max(1, args.repeat // 10))
+        matches = sum(facets['status'].values()) + sum(facets['category'].values())
+        print('%-14s %-14s %10.2f %10.2f %8d%s' % (name, query, index_ms, scan_ms, matches, '' if complete else '+'))
+
+
+if __name__ == '__main__':
+    main()
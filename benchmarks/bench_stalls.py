@@ -0,0 +1,120 @@
+"""Stall test: request latency while a worker imports and snapshots.
+
+Seeds a throwaway data directory with a large default ledger and starts
+gunicorn with the Docker image's worker class. Probe clients keep reading a
+second, small ledger, whose requests never need the big ledger's locks,
+while writer clients post to the big one. Partway through, an import into
+the big ledger holds its writer lock batch after batch and starts
+snapshots, so the other worker's writers wait on the lock. Reports probe
+latency while quiet and during the import; a worker that blocks its whole
+process on the disk or the lock shows up as a long tail.
+
+    python benchmarks/bench_stalls.py [--transactions 300000] [--import-rows 40000]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_suite import seed
+from bench_workers import free_port, wait_until_up
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROBE_LEDGER = 'probe'
+
+
+def probe(port, stop, samples):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.request('GET', '/api/transactions?limit=20&ledger=' + PROBE_LEDGER)
+        response = conn.getresponse()
+        response.read()
+        samples.append((time.perf_counter(), time.perf_counter() - start))
+        time.sleep(0.01)
+
+
+def writer(port, stop):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    body = json.dumps({'amount': 1, 'category': 'Personal', 'description': 'stall test'})
+    while not stop.is_set():
+        conn.request('POST', '/api/transactions', body, {'Content-Type': 'application/json'})
+        conn.getresponse().read()
+        time.sleep(0.05)
+
+
+def import_file(rows):
+    rng = random.Random(rows)
+    return ''.join(json.dumps({'date': '2024-%02d-%02d' % (rng.randint(1, 12), rng.randint(1, 28)),
+                               'amount': rng.randint(-50000, 50000) / 100,
+                               'description': 'imported %d' % i}) + '\n' for i in range(rows)).encode()
+
+
+def summary(samples):
+    latencies = sorted(latency * 1000 for _, latency in samples)
+    if not latencies:
+        return 'no requests'
+    return '%6d requests   p50 %7.1f ms   p99 %7.1f ms   max %7.1f ms' % (
+        len(latencies), latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100], latencies[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=300000)
+    parser.add_argument('--import-rows', type=int, default=40000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--probes', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--quiet-seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='osonai-stalls-')
+    data_dir = os.path.join(root, 'data')
+    subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'bench_suite.py'),
+                    '--seed', data_dir, str(args.transactions)], check=True)
+    os.makedirs(os.path.join(data_dir, 'ledgers', PROBE_LEDGER))
+    body = import_file(args.import_rows)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--worker-class', 'gevent', '--workers', str(args.workers),
+         '--bind', '127.0.0.1:%d' % port, '--timeout', '300', '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=dict(os.environ, OSONAI_DATA_DIR=data_dir))
+    stop = threading.Event()
+    samples = []
+    try:
+        wait_until_up(port, timeout=300)
+        threads = [threading.Thread(target=probe, args=(port, stop, samples)) for _ in range(args.probes)]
+        threads += [threading.Thread(target=writer, args=(port, stop)) for _ in range(args.writers)]
+        for t in threads:
+            t.start()
+        time.sleep(args.quiet_seconds)
+        started = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+        conn.request('POST', '/api/import?format=jsonl', body, {'Content-Type': 'application/x-ndjson'})
+        result = json.loads(conn.getresponse().read())
+        # Let the last snapshot finish
+        time.sleep(2)
+        finished = time.perf_counter()
+        stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        stop.set()
+        server.terminate()
+        server.wait()
+        shutil.rmtree(root)
+    print('%d transactions, %d workers, imported %d rows in %.1fs'
+          % (args.transactions, args.workers, result['imported'], result['seconds']))
+    print('quiet:         ' + summary([s for s in samples if s[0] < started]))
+    print('during import: ' + summary([s for s in samples if started <= s[0] <= finished]))
+
+
+if __name__ == '__main__':
+    main()
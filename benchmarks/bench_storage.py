@@ -0,0 +1,86 @@
+"""Journal storage benchmark: write throughput and cold-start replay.
+
+    python benchmarks/bench_storage.py [--records 1000000] [--threads 8]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from storage import JournalBackend  # noqa: E402
+from store import Store  # noqa: E402
+
+CATEGORIES = ["Personal", "Business", "Investment", "Savings"]
+IDEA_STATUSES = ["New", "In Progress", "Completed", "On Hold"]
+
+
+def transaction(i):
+    return {
+        'amount': float(i % 500 - 250),
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'description': 'transaction %d' % i,
+        'date': '2024-01-01 12:00',
+    }
+
+
+def open_store(path, **options):
+    return Store(CATEGORIES, IDEA_STATUSES, backend=JournalBackend(path, **options))
+
+
+def bench_writes(path, count, threads, sync):
+    store = open_store(path, sync=sync)
+    per_thread = count // threads
+
+    def worker(offset):
+        for i in range(offset, offset + per_thread):
+            store.add_transaction(transaction(i))
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    store.close()
+    elapsed = time.perf_counter() - start
+    print('writes  sync=%-8s %7d ops  %6.2fs  %9.0f ops/s' % (sync, per_thread * threads, elapsed, per_thread * threads / elapsed))
+
+
+def bench_cold_start(path, records, snapshot_every):
+    store = open_store(path, sync='none', snapshot_every=snapshot_every)
+    for i in range(records):
+        store.add_transaction(transaction(i))
+    store.close()
+
+    start = time.perf_counter()
+    store = open_store(path, snapshot_every=snapshot_every)
+    elapsed = time.perf_counter() - start
+    assert len(store.transactions) == records
+    store.close()
+    print('startup snapshot_every=%-8d %7d records  %6.2fs' % (snapshot_every, records, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--writes', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='osonai-bench-')
+    try:
+        for sync in ('interval', 'group'):
+            bench_writes(os.path.join(root, 'writes-' + sync), args.writes, args.threads, sync)
+        bench_cold_start(os.path.join(root, 'snapshotted'), args.records, 10000)
+        bench_cold_start(os.path.join(root, 'journal-only'), args.records, args.records + 1)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
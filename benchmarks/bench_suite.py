@@ -0,0 +1,167 @@
+"""Regression suite: per-route latency and memory by data size.
+
+For each size, seeds a throwaway data directory with that many synthetic
+transactions (and a tenth as many ideas) as a snapshot, then loads the app
+in a fresh process and drives it through the Flask test client: the
+dashboard both from the page cache and right after a write, the form
+routes, and the JSON reads. Reports p50/p99 per route, the mean dashboard
+aggregate and render times from the app's own metrics, the load time and
+the peak resident memory.
+
+    python benchmarks/bench_suite.py [--sizes 1000 100000 1000000] [--requests 200] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CATEGORIES = ["Personal", "Business", "Investment", "Savings"]
+IDEA_STATUSES = ["New", "In Progress", "Completed", "On Hold"]
+WORDS = ('coffee groceries rent salary invoice refund subscription travel train hotel dinner lunch '
+         'insurance dividend transfer savings bonus gym books software hosting laptop phone taxi').split()
+
+READS = [
+    ('GET /api/transactions', '/api/transactions'),
+    ('GET /api/search', '/api/search?q=coffee+ho'),
+    ('GET /api/balance_series', '/api/balance_series?bucket=day&categories=all'),
+]
+
+
+def seed(data_dir, size):
+    sys.path.insert(0, ROOT)
+    from storage import JournalBackend
+    from store import Store
+
+    rng = random.Random(size)
+    transactions = [{'id': i, 'amount': rng.randint(-50000, 50000) / 100, 'category': rng.choice(CATEGORIES),
+                     'description': '%s %s #%d' % (rng.choice(WORDS), rng.choice(WORDS), i),
+                     'date': '%d-%02d-%02d %02d:%02d' % (2015 + i * 10 // size, rng.randint(1, 12), rng.randint(1, 28),
+                                                         rng.randint(0, 23), rng.randint(0, 59))}
+                    for i in range(1, size + 1)]
+    ideas = [{'id': i, 'title': rng.choice(WORDS).title(), 'description': ' '.join(rng.sample(WORDS, 4)),
+              'status': rng.choice(IDEA_STATUSES), 'created_at': '2024-01-01T00:00:00'}
+             for i in range(1, size // 10 + 1)]
+    store = Store(CATEGORIES, IDEA_STATUSES, backend=JournalBackend(data_dir))
+    store._reset(ideas, transactions, {'ideas': len(ideas) + 1, 'transactions': size + 1})
+    store.backend.lock()
+    try:
+        store.backend.start_snapshot(store.snapshot_state())
+    finally:
+        store.backend.unlock()
+    store.close()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {'p50': samples[len(samples) // 2] * 1000, 'p99': samples[min(len(samples) - 1, len(samples) * 99 // 100)] * 1000}
+
+
+def measure(data_dir, requests):
+    os.environ['OSONAI_DATA_DIR'] = data_dir
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    from app import DEFAULT_LEDGER, app, ledgers, metrics
+    load = time.perf_counter() - start
+    store = ledgers.get(DEFAULT_LEDGER)
+    rss_loaded = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    client = app.test_client()
+    timings = {}
+
+    def timed(label, method, path, **kwargs):
+        start = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        timings.setdefault(label, []).append(time.perf_counter() - start)
+        assert response.status_code < 400, (path, response.status_code)
+        return response
+
+    transaction = {'amount': '12.50', 'category': 'Business', 'description': 'benchmark'}
+    idea = {'title': 'Benchmark', 'description': 'suite', 'status': 'New'}
+    client.get('/')
+    for _ in range(requests):
+        timed('GET / (cached)', 'GET', '/')
+    for _ in range(requests):
+        timed('POST /add_transaction', 'POST', '/add_transaction', data=transaction)
+        timed('GET / (after write)', 'GET', '/')
+        timed('POST /add_idea', 'POST', '/add_idea', data=idea)
+    with store.lock:
+        transaction_ids = store.transactions.ids[-requests:].tolist()
+        idea_ids = [record['id'] for record in store.ideas][-requests:]
+    for transaction_id, idea_id in zip(transaction_ids, idea_ids):
+        timed('POST /delete_transaction', 'POST', '/delete_transaction', data={'id': transaction_id})
+        timed('POST /delete_idea', 'POST', '/delete_idea', data={'id': idea_id})
+    for label, path in READS:
+        for _ in range(requests):
+            timed(label, 'GET', path)
+
+    routes = {label: percentiles(samples) for label, samples in timings.items()}
+    home = {}
+    for name in ('osonai_home_aggregate_seconds', 'osonai_home_render_seconds'):
+        histogram = metrics._histograms[(name, ())]
+        home[name] = histogram[-2] / histogram[-1] * 1000
+    ledgers.close()
+    return {
+        'load_seconds': load,
+        'rss_loaded_mb': rss_loaded / 1024,
+        'rss_peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'routes': routes,
+        'home_mean_ms': home,
+    }
+
+
+def run(size, requests):
+    root = tempfile.mkdtemp(prefix='osonai-suite-')
+    data_dir = os.path.join(root, 'data')
+    try:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, __file__, '--seed', data_dir, str(size)], check=True)
+        seeded = time.perf_counter() - start
+        # A fresh process, so the memory figures are the app's alone
+        output = subprocess.run([sys.executable, __file__, '--measure', data_dir, str(requests)],
+                                check=True, stdout=subprocess.PIPE).stdout
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        result.update(size=size, seed_seconds=seeded)
+        return result
+    finally:
+        shutil.rmtree(root)
+
+
+def report(result):
+    print('%d transactions: loaded in %.2fs, %.0f MB after load, %.0f MB peak'
+          % (result['size'], result['load_seconds'], result['rss_loaded_mb'], result['rss_peak_mb']))
+    for label, stats in result['routes'].items():
+        print('  %-28s p50 %8.2f ms   p99 %8.2f ms' % (label, stats['p50'], stats['p99']))
+    home = result['home_mean_ms']
+    print('  %-28s aggregate %5.2f ms   render %5.2f ms (mean per cache miss)'
+          % ('home', home['osonai_home_aggregate_seconds'], home['osonai_home_render_seconds']))
+
+
+def main():
+    if sys.argv[1:2] == ['--seed']:
+        return seed(sys.argv[2], int(sys.argv[3]))
+    if sys.argv[1:2] == ['--measure']:
+        return print(json.dumps(measure(sys.argv[2], int(sys.argv[3]))))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='print raw results, e.g. to diff against a baseline')
+    args = parser.parse_args()
+    results = []
+    for size in args.sizes:
+        result = run(size, args.requests)
+        results.append(result)
+        if not args.json:
+            report(result)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Bulk transfer benchmark: import and export throughput in rows per second.
+
+Writes a CSV statement to a temporary file, streams it into a fresh app
+through ``/api/import``, imports it again (every row a duplicate), then
+streams ``/api/export`` while tracking peak Python memory.
+
+    python benchmarks/bench_transfer.py [--rows 200000]
+"""
+import argparse
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+CATEGORIES = ["Personal", "Business", "Investment", "Savings"]
+PAYEES = ['Coffee House', 'Grocer', 'Landlord', 'Employer', 'Airline', 'Book Shop', 'Gym', 'Pharmacy']
+
+
+def write_statement(path, rows, seed=1):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Amount', 'Payee', 'Category'])
+        for i in range(rows):
+            day = i * 365 // rows
+            writer.writerow(['2024-%02d-%02d %02d:%02d' % (day // 31 + 1, day % 28 + 1, i // 60 % 24, i % 60),
+                             '%.2f' % (rng.randint(-20000, 20000) / 100),
+                             '%s #%d' % (rng.choice(PAYEES), i), rng.choice(CATEGORIES)])
+
+
+def run_import(client, path):
+    with open(path, 'rb') as f:
+        start = time.perf_counter()
+        response = client.post('/api/import?format=csv', input_stream=f, content_length=os.path.getsize(path))
+        elapsed = time.perf_counter() - start
+    result = response.get_json()
+    assert response.status_code == 200, result
+    return result, elapsed
+
+
+def run_export(client, fmt):
+    response = client.get('/api/export?format=%s' % fmt, buffered=False)
+    size = rows = 0
+    start = time.perf_counter()
+    for chunk in response.iter_encoded():
+        size += len(chunk)
+        rows += chunk.count(b"\n")
+    elapsed = time.perf_counter() - start
+    response.close()
+    return rows - (fmt == 'csv'), size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='osonai-transfer-')
+    os.environ['OSONAI_DATA_DIR'] = os.path.join(root, 'data')
+    try:
+        path = os.path.join(root, 'statement.csv')
+        write_statement(path, args.rows)
+        from app import app, ledgers
+        client = app.test_client()
+
+        for label in ('import', 'reimport'):
+            result, elapsed = run_import(client, path)
+            print('%-9s %8d rows  %8d new  %8d duplicates  %6.2fs  %8.0f rows/s'
+                  % (label, result['rows'], result['imported'], result['duplicates'], elapsed, result['rows'] / elapsed))
+
+        for fmt in ('csv', 'jsonl'):
+            rows, size, elapsed = run_export(client, fmt)
+            print('export    %8d rows  %-5s %6.1f MB  %6.2fs  %8.0f rows/s' % (rows, fmt, size / 1e6, elapsed, rows / elapsed))
+
+        tracemalloc.start()
+        run_export(client, 'csv')
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('export    peak Python memory while streaming: %.1f MB' % (peak / 1e6))
+        ledgers.close()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Load test: throughput of the gunicorn serving mode by worker count.
+
+Starts ``gunicorn app:app`` against a throwaway data directory for each
+worker count, drives it with concurrent keep-alive clients doing a mix of
+dashboard reads, page reads and writes, and reports requests per second.
+
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--seconds 10]
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/ideas')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def client(port, deadline, write_ratio, counts, index):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    body = json.dumps({'amount': 1, 'category': 'Personal', 'description': 'load test'})
+    done = 0
+    while time.time() < deadline:
+        if done % 100 < write_ratio * 100:
+            conn.request('POST', '/api/transactions', body, {'Content-Type': 'application/json'})
+        elif done % 2:
+            conn.request('GET', '/api/transactions?limit=50')
+        else:
+            conn.request('GET', '/')
+        response = conn.getresponse()
+        response.read()
+        if response.status >= 400:
+            raise RuntimeError('HTTP %d' % response.status)
+        done += 1
+    counts[index] = done
+
+
+def run(workers, clients, seconds, write_ratio):
+    data_dir = tempfile.mkdtemp(prefix='osonai-load-')
+    port = free_port()
+    env = dict(os.environ, OSONAI_DATA_DIR=data_dir)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--worker-class', 'gevent', '--workers', str(workers),
+         '--bind', '127.0.0.1:%d' % port, '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=env)
+    try:
+        wait_until_up(port)
+        counts = [0] * clients
+        deadline = time.time() + seconds
+        threads = [threading.Thread(target=client, args=(port, deadline, write_ratio, counts, i))
+                   for i in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        total = sum(counts)
+        print('workers=%-2d clients=%-3d %8d requests  %8.0f req/s' % (workers, clients, total, total / seconds))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(data_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+    print('%d CPUs' % os.cpu_count())
+    for workers in args.workers:
+        run(workers, args.clients, args.seconds, args.write_ratio)
+
+
+if __name__ == '__main__':
+    main()
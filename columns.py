@@ -0,0 +1,346 @@
+import calendar
+import hashlib
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from functools import lru_cache
+from itertools import accumulate, compress
+
+from aggregates import to_cents
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+
+# Stored dates are minute precision, so replays and imports repeat them a lot
+@lru_cache(maxsize=4096)
+def parse_timestamp(value):
+    """``'%Y-%m-%d[ %H:%M[:%S]]'`` (naive, as stored) to epoch seconds."""
+    return calendar.timegm(datetime.fromisoformat(value).timetuple())
+
+
+def format_timestamp(ts):
+    return time.strftime(DATE_FORMAT, time.gmtime(ts))
+
+
+def period_bounds(start, end):
+    """Epoch bounds ``[low, high)`` for an inclusive ``start``/``end`` date
+    range given at year, month, day or minute precision; either may be None."""
+    low = high = None
+    if start:
+        low = parse_timestamp(_pad(start))
+    if end:
+        begin = datetime.fromisoformat(_pad(end))
+        if len(end) == 4:
+            after = begin.replace(year=begin.year + 1)
+        elif len(end) == 7:
+            after = begin.replace(year=begin.year + begin.month // 12, month=begin.month % 12 + 1)
+        elif len(end) == 10:
+            after = datetime.fromordinal(begin.toordinal() + 1)
+        else:
+            # Minute (or second) precision
+            return low, parse_timestamp(end) + (60 if len(end) <= 16 else 1)
+        high = calendar.timegm(after.timetuple())
+    return low, high
+
+
+def fingerprint(ts, cents, description):
+    """64-bit digest of what makes two transactions duplicates: the same
+    date, amount and description."""
+    data = b'%d|%d|' % (ts, cents) + (description or '').encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def transaction_fingerprint(transaction):
+    return fingerprint(parse_timestamp(transaction['date']), to_cents(transaction.get('amount') or 0),
+                       transaction.get('description'))
+
+
+def _pad(value):
+    return value + '-01-01'[len(value) - 4:] if len(value) < 10 else value
+
+
+class TransactionColumns:
+    """Transactions stored column by column instead of one dict each.
+
+    Amounts are integer cents, categories one-byte codes into
+    ``category_names``, dates epoch seconds, and descriptions UTF-8 slices of
+    a single byte buffer. Rows are materialised as dicts only when read.
+
+    Ids are assigned in increasing order, so the id column is sorted and
+    doubles as the index: lookups bisect it instead of keeping a dict, which
+    would cost more memory than all the columns together. Deletes clear the
+    row's ``alive`` byte and :meth:`compact` drops dead rows later.
+    """
+
+    def __init__(self, categories, records=(), next_id=1):
+        self.category_names = []
+        self.category_codes = {}
+        for category in categories:
+            self._code(category)
+        self.ids = array('q')
+        self.cents = array('q')
+        self.codes = bytearray()
+        self.timestamps = array('q')
+        self.text = bytearray()
+        self.text_offsets = array('q')
+        self.text_lengths = array('i')
+        self.alive = bytearray()
+        self.next_id = next_id
+        self.tombstones = 0
+        # Whether timestamps are non-decreasing in row order, which lets
+        # date ranges be located by bisection instead of a scan
+        self.time_sorted = True
+        for record in records:
+            self.insert(record)
+
+    def _code(self, category):
+        code = self.category_codes.get(category)
+        if code is None:
+            if len(self.category_names) == 256:
+                raise ValueError('too many distinct categories')
+            code = self.category_codes[category] = len(self.category_names)
+            self.category_names.append(category)
+        return code
+
+    def __len__(self):
+        return len(self.ids) - self.tombstones
+
+    def __iter__(self):
+        return (self.row(position) for position in compress(range(len(self.ids)), self.alive))
+
+    def texts(self):
+        """``(id, category, description)`` for every live row, without
+        materialising whole rows."""
+        names, text = self.category_names, self.text
+        for position in compress(range(len(self.ids)), self.alive):
+            length = self.text_lengths[position]
+            offset = self.text_offsets[position]
+            description = None if length < 0 else text[offset:offset + length].decode('utf-8')
+            yield self.ids[position], names[self.codes[position]], description
+
+    def fingerprints(self):
+        """:func:`fingerprint` of every live row."""
+        descriptions = (description for _, _, description in self.texts())
+        for ts, cents, description in zip(
+                compress(self.timestamps, self.alive), compress(self.cents, self.alive), descriptions):
+            yield fingerprint(ts, cents, description)
+
+    def _position(self, record_id):
+        position = bisect_left(self.ids, record_id)
+        if position < len(self.ids) and self.ids[position] == record_id and self.alive[position]:
+            return position
+        return None
+
+    def row(self, position):
+        length = self.text_lengths[position]
+        if length < 0:
+            description = None
+        else:
+            offset = self.text_offsets[position]
+            description = self.text[offset:offset + length].decode('utf-8')
+        return {
+            'id': self.ids[position],
+            'amount': self.cents[position] / 100,
+            'category': self.category_names[self.codes[position]],
+            'description': description,
+            'date': format_timestamp(self.timestamps[position]),
+        }
+
+    def get(self, record_id):
+        position = self._position(record_id)
+        return None if position is None else self.row(position)
+
+    def insert(self, record):
+        record_id = record['id']
+        if self.ids and record_id <= self.ids[-1]:
+            raise ValueError('transaction ids must increase')
+        # Everything that can fail happens before the first append, so a bad
+        # record leaves the columns as they were
+        ts = parse_timestamp(record['date'])
+        cents = to_cents(record.get('amount') or 0)
+        code = self._code(record.get('category'))
+        description = record.get('description')
+        encoded = None if description is None else description.encode('utf-8')
+        # Raises OverflowError unless all three fit the int64 columns
+        array('q', (record_id, cents, ts))
+        if self.timestamps and ts < self.timestamps[-1]:
+            self.time_sorted = False
+        self.ids.append(record_id)
+        self.cents.append(cents)
+        self.codes.append(code)
+        self.timestamps.append(ts)
+        self.text_offsets.append(len(self.text))
+        if encoded is None:
+            self.text_lengths.append(-1)
+        else:
+            self.text.extend(encoded)
+            self.text_lengths.append(len(encoded))
+        self.alive.append(1)
+        self.next_id = max(self.next_id, record_id + 1)
+
+    def pop(self, next_id):
+        """Undo the last :meth:`insert`, putting ``next_id`` back."""
+        self.ids.pop()
+        self.cents.pop()
+        self.codes.pop()
+        self.timestamps.pop()
+        del self.text[self.text_offsets.pop():]
+        self.text_lengths.pop()
+        self.alive.pop()
+        self.next_id = next_id
+
+    def remove(self, record_id):
+        position = self._position(record_id)
+        if position is None:
+            return None
+        record = self.row(position)
+        self.alive[position] = 0
+        self.tombstones += 1
+        return record
+
+    def restore(self, record_id):
+        """Undo :meth:`remove` of ``record_id``."""
+        position = bisect_left(self.ids, record_id)
+        self.alive[position] = 1
+        self.tombstones -= 1
+
+    # Vectorised scans: masks are bytes of 0/1 per row, combined as big
+    # integers and applied with itertools.compress, all in C
+
+    def category_mask(self, category):
+        code = self.category_codes.get(category)
+        if code is None:
+            return bytes(len(self.codes))
+        table = bytearray(256)
+        table[code] = 1
+        return self.codes.translate(table)
+
+    def time_slice(self, low=None, high=None):
+        """Row positions ``range`` covering ``[low, high)``; only meaningful
+        while ``time_sorted``."""
+        start = 0 if low is None else bisect_left(self.timestamps, low)
+        stop = len(self.timestamps) if high is None else bisect_left(self.timestamps, high)
+        return range(start, max(start, stop))
+
+    def time_mask(self, low=None, high=None):
+        count = len(self.timestamps)
+        if self.time_sorted:
+            rows = self.time_slice(low, high)
+            return bytes(rows.start) + b'\x01' * len(rows) + bytes(count - rows.stop)
+        low = -2 ** 63 if low is None else low
+        high = 2 ** 63 - 1 if high is None else high
+        return bytes(low <= ts < high for ts in self.timestamps)
+
+    def mask(self, category=None, low=None, high=None):
+        masks = []
+        if self.tombstones:
+            masks.append(self.alive)
+        if category is not None:
+            masks.append(self.category_mask(category))
+        if low is not None or high is not None:
+            masks.append(self.time_mask(low, high))
+        if not masks:
+            return self.alive
+        mask = masks[0]
+        for other in masks[1:]:
+            mask = _and(mask, other)
+        return mask
+
+    def sum_cents(self, category=None, low=None, high=None):
+        return sum(compress(self.cents, self.mask(category, low, high)))
+
+    def count(self, category=None, low=None, high=None):
+        return sum(self.mask(category, low, high))
+
+    # Paging, same contract as store.Table.page
+
+    def page(self, cursor=None, limit=50, category=None, start=None, end=None):
+        low, high = period_bounds(start, end)
+        code = self.category_codes.get(category, -1) if category else None
+        position = len(self.ids) if cursor is None else bisect_left(self.ids, cursor)
+        items = []
+        while position > 0 and len(items) < limit:
+            position -= 1
+            if not self.alive[position]:
+                continue
+            if code is not None and self.codes[position] != code:
+                continue
+            ts = self.timestamps[position]
+            if (low is not None and ts < low) or (high is not None and ts >= high):
+                continue
+            items.append(self.row(position))
+        next_cursor = items[-1]['id'] if len(items) == limit and position > 0 else None
+        return items, next_cursor
+
+    # Compaction and snapshots
+
+    def needs_compaction(self):
+        return self.tombstones >= 1024 and self.tombstones * 4 >= len(self.ids)
+
+    def compact(self):
+        alive = self.alive
+        text, offsets, lengths = self.text, self.text_offsets, self.text_lengths
+        new_text = bytearray()
+        new_offsets = array('q')
+        new_lengths = array('i')
+        for position in compress(range(len(alive)), alive):
+            length = lengths[position]
+            new_offsets.append(len(new_text))
+            new_lengths.append(length)
+            if length > 0:
+                offset = offsets[position]
+                new_text += text[offset:offset + length]
+        self.ids = array('q', compress(self.ids, alive))
+        self.cents = array('q', compress(self.cents, alive))
+        self.codes = bytearray(compress(self.codes, alive))
+        self.timestamps = array('q', compress(self.timestamps, alive))
+        self.text, self.text_offsets, self.text_lengths = new_text, new_offsets, new_lengths
+        self.alive = bytearray(b'\x01' * len(self.ids))
+        self.tombstones = 0
+
+    def freeze(self):
+        """Copy the columns for a snapshot. Cheap (memcpy) so it can run
+        under the store lock; encoding happens later on the snapshot thread."""
+        return {
+            'columns': 1,
+            'category_names': list(self.category_names),
+            'ids': array('q', self.ids),
+            'cents': array('q', self.cents),
+            'codes': bytes(self.codes),
+            'timestamps': array('q', self.timestamps),
+            'text': bytes(self.text),
+            'text_lengths': array('i', self.text_lengths),
+            'alive': bytes(self.alive),
+        }
+
+    @classmethod
+    def thaw(cls, categories, state, next_id=1):
+        """Rebuild from :meth:`freeze` output as decoded from a snapshot."""
+        table = cls(state['category_names'], next_id=next_id)
+        for category in categories:
+            table._code(category)
+        table.ids = array('q', state['ids'])
+        table.cents = array('q', state['cents'])
+        table.codes = bytearray(_bytes(state['codes']))
+        table.timestamps = array('q', state['timestamps'])
+        table.text = bytearray(_bytes(state['text']))
+        table.text_lengths = array('i', state['text_lengths'])
+        table.text_offsets = array('q', accumulate((max(n, 0) for n in table.text_lengths), initial=0))
+        table.text_offsets.pop()
+        table.alive = bytearray(_bytes(state['alive']))
+        table.tombstones = len(table.alive) - sum(table.alive)
+        table.time_sorted = all(a <= b for a, b in zip(table.timestamps, table.timestamps[1:]))
+        if table.ids:
+            table.next_id = max(table.next_id, table.ids[-1] + 1)
+        return table
+
+
+def _bytes(value):
+    # Snapshots carry byte columns as latin-1 strings (see storage.encode)
+    return value.encode('latin-1') if isinstance(value, str) else value
+
+
+def _and(a, b):
+    count = len(a)
+    return (int.from_bytes(a, 'little') & int.from_bytes(b, 'little')).to_bytes(count, 'little')
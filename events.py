@@ -0,0 +1,77 @@
+import json
+import threading
+from collections import deque
+
+RESYNC = 'resync'
+
+
+def format_event(name, data, event_id=None):
+    """One server-sent event, ready to write to the stream."""
+    head = 'id: %s\n' % event_id if event_id is not None else ''
+    return '%sevent: %s\ndata: %s\n\n' % (head, name, json.dumps(data, separators=(',', ':')))
+
+
+class Broadcaster:
+    """Fans server-sent events out to any number of subscribers.
+
+    Events are encoded once per publish and :meth:`publish` never blocks on
+    a subscriber: each has a queue of at most ``limit`` messages. One that
+    falls further behind than that has its backlog dropped for a single
+    ``resync`` event, telling the client to refetch rather than replay.
+    """
+
+    def __init__(self, limit=256):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, events, event_id=None):
+        """Send ``events``, a list of ``(name, data)``, to every subscriber."""
+        messages = [format_event(name, data, event_id) for name, data in events]
+        resync = format_event(RESYNC, {}, event_id)
+        with self._lock:
+            for subscription in self._subscribers:
+                subscription._push(messages, resync, self.limit)
+
+
+class Subscription:
+
+    def __init__(self, broadcaster):
+        self._broadcaster = broadcaster
+        self._queue = deque()
+        self._ready = threading.Condition(threading.Lock())
+
+    def _push(self, messages, resync, limit):
+        with self._ready:
+            if len(self._queue) + len(messages) > limit:
+                self._queue.clear()
+                self._queue.append(resync)
+            else:
+                self._queue.extend(messages)
+            self._ready.notify()
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds and return every queued message
+        as one string, or '' if there were none."""
+        with self._ready:
+            if not self._queue:
+                self._ready.wait(timeout)
+            messages = ''.join(self._queue)
+            self._queue.clear()
+            return messages
+
+    def close(self):
+        self._broadcaster._unsubscribe(self)
@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+
+from storage import JournalBackend, read_summary
+from store import Store
+
+DEFAULT_LEDGER = 'personal'
+NAME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,39}$')
+
+
+class Ledgers:
+    """Named ledgers, each a :class:`store.Store` with its own journal.
+
+    The default ledger lives in the data directory itself, where the single
+    store always did, and every other one in ``ledgers/<name>/`` below it.
+    Each ledger has its own lock and journal, so writes to different
+    ledgers never wait for each other. Stores are opened on first use;
+    ledgers created by other worker processes are found the same way.
+    """
+
+    def __init__(self, path, categories, idea_statuses, default=DEFAULT_LEDGER):
+        self.path = path
+        self.categories = categories
+        self.idea_statuses = idea_statuses
+        self.default = default
+        # Called with (name, store) for every newly opened store
+        self.on_open = None
+        self._stores = {}
+        self._lock = threading.Lock()
+        self._totals = Totals(categories)
+
+    def _path(self, name):
+        if name == self.default:
+            return self.path
+        return os.path.join(self.path, 'ledgers', name)
+
+    def names(self):
+        try:
+            names = [name for name in os.listdir(os.path.join(self.path, 'ledgers')) if NAME.match(name)]
+        except FileNotFoundError:
+            names = []
+        return [self.default] + sorted(name for name in names if name != self.default)
+
+    def items(self):
+        """The ``(name, store)`` pairs opened so far in this process."""
+        return list(self._stores.items())
+
+    def get(self, name):
+        """The store of ledger ``name``, or None if there is no such ledger."""
+        store = self._stores.get(name)
+        if store is not None:
+            return store
+        if not NAME.match(name) or not (name == self.default or os.path.isdir(self._path(name))):
+            return None
+        return self._open(name)
+
+    def create(self, name):
+        """Create ledger ``name``; False if it exists already."""
+        if not NAME.match(name):
+            raise ValueError('ledger names are 1-40 lowercase letters, digits, - or _')
+        if name == self.default:
+            return False
+        try:
+            os.makedirs(self._path(name))
+        except FileExistsError:
+            return False
+        self._open(name)
+        return True
+
+    def _open(self, name):
+        # One lock for opening only; loading a large ledger never blocks
+        # requests to the ledgers that are open already
+        with self._lock:
+            store = self._stores.get(name)
+            if store is None:
+                store = Store(self.categories, self.idea_statuses, backend=JournalBackend(self._path(name)))
+                if self.on_open is not None:
+                    self.on_open(name, store)
+                self._stores[name] = store
+            return store
+
+    def summaries(self):
+        """Per-ledger aggregates plus totals over every ledger.
+
+        Figures come from the summary file each ledger's writer keeps next
+        to its journal, so no ledger is loaded for them. The totals only
+        re-add the ledgers whose journal position moved since the last call.
+        """
+        ledgers = {}
+        for name in self.names():
+            saved = read_summary(self._path(name))
+            if saved is None:
+                # No summary yet, or a stale one: load the ledger once to write it
+                store = self.get(name)
+                if store is None:
+                    continue
+                saved = store.save_summary()
+            figures, position = saved
+            ledgers[name] = summary(self._totals.update(name, position, figures))
+        return ledgers, self._totals.to_dict()
+
+    def totals(self):
+        """``(version, totals)``: the totals over every ledger, as
+        :meth:`summaries` has them, and a number that changes with them."""
+        self.summaries()
+        return self._totals.current()
+
+    def close(self):
+        for store in self._stores.values():
+            store.close()
+
+
+class Totals:
+    """Aggregates summed over ledgers, updated by the difference a ledger's
+    new figures make instead of re-summing all of them."""
+
+    def __init__(self, categories):
+        self.seen = {}
+        self.version = 0
+        self.balance_cents = 0
+        self.transaction_count = 0
+        self.idea_count = 0
+        self.active_ideas_count = 0
+        self.category_cents = {category: 0 for category in categories}
+        self._lock = threading.Lock()
+
+    def update(self, name, version, figures):
+        with self._lock:
+            seen = self.seen.get(name)
+            if seen is not None and seen[0] == version:
+                return seen[1]
+            if seen is not None:
+                self._add(seen[1], -1)
+            self._add(figures, 1)
+            self.seen[name] = version, figures
+            self.version += 1
+            return figures
+
+    def _add(self, figures, sign):
+        self.balance_cents += sign * figures['balance_cents']
+        self.transaction_count += sign * figures['transaction_count']
+        self.idea_count += sign * figures['idea_count']
+        self.active_ideas_count += sign * figures['active_ideas_count']
+        for category, cents in figures['category_cents'].items():
+            self.category_cents[category] = self.category_cents.get(category, 0) + sign * cents
+
+    def to_dict(self):
+        return self.current()[1]
+
+    def current(self):
+        with self._lock:
+            return self.version, summary(vars(self))
+
+
+def summary(figures):
+    return {
+        'total_balance': figures['balance_cents'] / 100,
+        'transaction_count': figures['transaction_count'],
+        'idea_count': figures['idea_count'],
+        'active_ideas_count': figures['active_ideas_count'],
+        'category_totals': {category: cents / 100 for category, cents in figures['category_cents'].items()},
+    }
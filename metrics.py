@@ -0,0 +1,215 @@
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds, from sub-millisecond API calls to slow renders
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger(__name__)
+
+
+class Registry:
+    """Counters, gauges and fixed-bucket histograms in Prometheus terms.
+
+    Recording is a dict lookup, a bisect and a few additions under one lock.
+    With ``path`` set, every worker process also dumps its own series to
+    ``<path>/<pid>.json`` at most once a ``flush_interval``, and
+    :meth:`render` merges those of every live worker, so a scrape that lands
+    on any one of them sees the whole server.
+    """
+
+    def __init__(self, path=None, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.help = {}
+        self.types = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._flushed = 0.0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def describe(self, name, kind, text):
+        self.types[name] = kind
+        self.help[name] = text
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, seconds, labels=()):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Bucket counts, then the sum and the count
+                histogram = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0]
+            histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+        self._maybe_flush()
+
+    def set(self, name, value, labels=()):
+        with self._lock:
+            self._gauges[(name, labels)] = value
+
+    def time(self, name, labels=()):
+        return _Timer(self, name, labels)
+
+    # Sharing between worker processes
+
+    def _maybe_flush(self):
+        if self.path is not None and time.monotonic() - self._flushed >= self.flush_interval:
+            # A flush already under way in another thread will do
+            if self._flush_lock.acquire(blocking=False):
+                try:
+                    self._flush()
+                finally:
+                    self._flush_lock.release()
+
+    def _state(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, labels, list(value)] for (name, labels), value in self._histograms.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self._gauges.items()],
+            }
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        # Runs in the request path, so a failed dump is logged, never raised
+        self._flushed = time.monotonic()
+        path = os.path.join(self.path, '%d.json' % os.getpid())
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.path)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._state(), f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except Exception:
+            log.exception('could not write metrics to %s', path)
+
+    def _states(self):
+        states = [self._state()]
+        if self.path is None:
+            return states
+        for path in glob.glob(os.path.join(self.path, '*.json')):
+            pid = int(os.path.basename(path)[:-5])
+            if pid == os.getpid():
+                continue
+            if not _alive(pid):
+                # Another worker may be removing it as well
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    states.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return states
+
+    # Exposition
+
+    def render(self):
+        """All series in the Prometheus text format, summed over workers.
+        Gauges are per process and keep a ``pid`` label instead."""
+        counters = {}
+        histograms = {}
+        gauges = []
+        for state in self._states():
+            for name, labels, value in state['counters']:
+                key = (name, _key(labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in state['histograms']:
+                key = (name, _key(labels))
+                total = histograms.get(key)
+                histograms[key] = value if total is None else [a + b for a, b in zip(total, value)]
+            for name, labels, value in state['gauges']:
+                gauges.append((name, _key(labels) + (('pid', str(state['pid'])),), value))
+        lines = []
+        described = set()
+        for (name, labels), value in sorted(counters.items()):
+            self._header(lines, described, name)
+            lines.append('%s%s %s' % (name, _labels(labels), _number(value)))
+        for (name, labels), value in sorted(histograms.items()):
+            self._header(lines, described, name)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), value):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_bucket%s %d' % (name, _labels(labels + (('le', le),)), cumulative))
+            lines.append('%s_sum%s %s' % (name, _labels(labels), _number(value[-2])))
+            lines.append('%s_count%s %d' % (name, _labels(labels), value[-1]))
+        for name, labels, value in sorted(gauges):
+            self._header(lines, described, name)
+            lines.append('%s%s %s' % (name, _labels(labels), _number(value)))
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines, described, name):
+        if name in described:
+            return
+        described.add(name)
+        if name in self.help:
+            lines.append('# HELP %s %s' % (name, self.help[name]))
+            lines.append('# TYPE %s %s' % (name, self.types[name]))
+
+
+class _Timer:
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, self.labels)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _key(labels):
+    # Labels travel through JSON as lists of pairs
+    return tuple(tuple(pair) for pair in labels)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in labels)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,411 @@
+import re
+from bisect import bisect_left, insort
+from datetime import date
+from heapq import nsmallest
+from itertools import compress
+
+from aggregates import to_cents
+from columns import parse_timestamp, period_bounds
+from series import EPOCH_ORDINAL
+
+# Card numbers, references and dates make every description unique; top
+# descriptions group by what is left once tokens with digits are dropped
+_NUMBERED = re.compile(r'(?<!\S)\S*\d\S*')
+
+
+def description_key(description):
+    if not description:
+        return ''
+    return ' '.join(_NUMBERED.sub('', description).lower().split())[:60]
+
+
+def month_of(ordinal):
+    value = date.fromordinal(ordinal)
+    return value.year * 12 + value.month - 1
+
+
+def month_label(month):
+    return '%04d-%02d' % (month // 12, month % 12 + 1)
+
+
+def first_day(month):
+    return date(month // 12, month % 12 + 1, 1).toordinal()
+
+
+def _description_keys(columns):
+    """:func:`description_key` of every live row of ``columns``, with the
+    regular expression and case folding run once over all descriptions."""
+    text, alive = columns.text, columns.alive
+    descriptions = [text[offset:offset + length] if length > 0 else b''
+                    for offset, length in compress(zip(columns.text_offsets, columns.text_lengths), alive)]
+    # The unit separator is whitespace, so no numbered token spans two
+    # descriptions; one inside a description shows up as a miscount
+    cleaned = _NUMBERED.sub('', b'\x1f'.join(descriptions).decode('utf-8')).lower().split('\x1f')
+    if len(cleaned) != len(descriptions):
+        return [description_key(description.decode('utf-8')) for description in descriptions]
+    return [' '.join(description.split())[:60] for description in cleaned]
+
+
+class Rollup:
+    """Totals for one block of time: income, expense and count per category,
+    and count and net per category and description key, for the block as a
+    whole and for each of its days."""
+
+    __slots__ = ('categories', 'descriptions', 'days')
+
+    def __init__(self):
+        self.categories = {}
+        self.descriptions = {}
+        # day ordinal -> (categories, descriptions) of that day alone
+        self.days = {}
+
+    def add(self, day, code, cents, key, sign=1):
+        figures = self.days.get(day)
+        if figures is None:
+            figures = self.days[day] = {}, {}
+        _add_figures(figures[0], code, cents, sign)
+        _add_description(figures[1], code, key, cents, sign)
+        _add_figures(self.categories, code, cents, sign)
+        _add_description(self.descriptions, code, key, cents, sign)
+
+    def include(self, categories, descriptions):
+        _merge_figures(self.categories, categories)
+        _merge_descriptions(self.descriptions, descriptions)
+
+    def copy(self):
+        return Rollup.from_days({
+            day: ({code: list(entry) for code, entry in categories.items()},
+                  {key: list(entry) for key, entry in descriptions.items()})
+            for day, (categories, descriptions) in self.days.items()})
+
+    @classmethod
+    def from_days(cls, days):
+        rollup = cls()
+        rollup.days = days
+        for categories, descriptions in days.values():
+            rollup.include(categories, descriptions)
+        return rollup
+
+    @classmethod
+    def merge(cls, rollups):
+        merged = cls()
+        for rollup in rollups:
+            merged.include(rollup.categories, rollup.descriptions)
+            # Blocks never share days, so the day figures can be shared. A
+            # month's days are patched in place later, but only together
+            # with dropping every year rollup that shares them
+            merged.days.update(rollup.days)
+        return merged
+
+
+def _add_figures(figures, code, cents, sign):
+    entry = figures.get(code)
+    if entry is None:
+        entry = figures[code] = [0, 0, 0]
+    entry[0 if cents >= 0 else 1] += sign * cents
+    entry[2] += sign
+
+
+def _merge_figures(figures, other):
+    for code, (income, expense, count) in other.items():
+        entry = figures.get(code)
+        if entry is None:
+            figures[code] = [income, expense, count]
+        else:
+            entry[0] += income
+            entry[1] += expense
+            entry[2] += count
+
+
+def _merge_descriptions(descriptions, other):
+    for entry, (count, cents) in other.items():
+        total = descriptions.get(entry)
+        if total is None:
+            descriptions[entry] = [count, cents]
+        else:
+            total[0] += count
+            total[1] += cents
+
+
+def _add_description(descriptions, code, key, cents, sign):
+    entry = descriptions.get((code, key))
+    if entry is None:
+        descriptions[(code, key)] = [1, cents]
+    elif entry[0] + sign:
+        entry[0] += sign
+        entry[1] += sign * cents
+    else:
+        del descriptions[(code, key)]
+
+
+class Reports:
+    """Date-range reports over a :class:`columns.TransactionColumns`.
+
+    Totals come from a rollup per month, all built at load in one pass over
+    the rows (or restored from a snapshot), and per-year ones merged from
+    them on first use and cached. The month keys are kept sorted, so a range
+    is located by bisection. A mutation patches the rollup of its month in
+    place and drops that of its year; no other month or year is touched. A
+    range sums whole years, then whole months, and the days of the partial
+    months at either end, so no query reads individual rows.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.keys = []
+        self.month_rollups = {}
+        self.year_rollups = {}
+        self._month_of = {}
+        # Month rollups as of the last freeze, shared with the copy being
+        # written out and so copied before being patched
+        self._frozen = None
+
+    def _month(self, day):
+        month = self._month_of.get(day)
+        if month is None:
+            month = self._month_of[day] = month_of(day)
+        return month
+
+    @classmethod
+    def build(cls, columns):
+        """Build every month's rollup in one pass over the rows, grouping by
+        day, category and description key first, like
+        :meth:`series.BalanceSeries.from_columns`."""
+        alive = columns.alive
+        groups = {}
+        rows = zip(compress(columns.timestamps, alive), compress(columns.codes, alive),
+                   compress(columns.cents, alive), _description_keys(columns))
+        for ts, code, cents, key in rows:
+            group = (ts // 86400 + EPOCH_ORDINAL, code, key)
+            entry = groups.get(group)
+            if entry is None:
+                entry = groups[group] = [0, 0, 0]
+            entry[0 if cents >= 0 else 1] += cents
+            entry[2] += 1
+        days = {}
+        # One tuple per category and description key, shared by every day
+        pairs = {}
+        for (day, code, key), (income, expense, count) in groups.items():
+            pair = (code, key)
+            pair = pairs.setdefault(pair, pair)
+            figures = days.get(day)
+            if figures is None:
+                figures = days[day] = {}, {}
+            entry = figures[0].get(code)
+            if entry is None:
+                figures[0][code] = [income, expense, count]
+            else:
+                entry[0] += income
+                entry[1] += expense
+                entry[2] += count
+            figures[1][pair] = [count, income + expense]
+        return cls._from_days(columns, days)
+
+    @classmethod
+    def _from_days(cls, columns, days):
+        reports = cls(columns)
+        months = {}
+        for day, figures in days.items():
+            months.setdefault(reports._month(day), {})[day] = figures
+        reports.month_rollups = {month: Rollup.from_days(month_days) for month, month_days in months.items()}
+        reports.keys = sorted(months)
+        return reports
+
+    def freeze(self):
+        """Copy the rollups for a snapshot. Only the dict of months is copied
+        under the store lock; a month patched later is copied first (copy on
+        write). Returns a function that encodes the copy as day figures,
+        meant for the snapshot thread."""
+        months = self._frozen = dict(self.month_rollups)
+
+        def encode():
+            state = [
+                [day, [[code] + entry for code, entry in categories.items()],
+                 [[code, key] + entry for (code, key), entry in descriptions.items()]]
+                for rollup in months.values() for day, (categories, descriptions) in rollup.days.items()]
+            if self._frozen is months:
+                self._frozen = None
+            return state
+        return encode
+
+    @classmethod
+    def thaw(cls, columns, state):
+        """Rebuild from :meth:`freeze` output as decoded from a snapshot."""
+        days = {}
+        pairs = {}
+        for day, categories, descriptions in state:
+            day_descriptions = {}
+            for code, key, count, cents in descriptions:
+                pair = (code, key)
+                day_descriptions[pairs.setdefault(pair, pair)] = [count, cents]
+            days[day] = ({code: [income, expense, count] for code, income, expense, count in categories},
+                         day_descriptions)
+        return cls._from_days(columns, days)
+
+    def _changed(self, transaction, sign):
+        ts = parse_timestamp(transaction['date'])
+        day = ts // 86400 + EPOCH_ORDINAL
+        month = self._month(day)
+        rollup = self.month_rollups.get(month)
+        frozen = self._frozen
+        if rollup is None:
+            rollup = self.month_rollups[month] = Rollup()
+            insort(self.keys, month)
+        elif frozen is not None and frozen.get(month) is rollup:
+            rollup = self.month_rollups[month] = rollup.copy()
+        rollup.add(day, self.columns.category_codes[transaction['category']],
+                   to_cents(transaction.get('amount') or 0), description_key(transaction.get('description')), sign)
+        # The year is re-merged from its months on next use
+        self.year_rollups.pop(month // 12, None)
+
+    def add_transaction(self, transaction):
+        self._changed(transaction, 1)
+
+    def remove_transaction(self, transaction):
+        self._changed(transaction, -1)
+
+    # Rollups
+
+    def month_rollup(self, month):
+        rollup = self.month_rollups.get(month)
+        return Rollup() if rollup is None else rollup
+
+    def year_rollup(self, year):
+        rollup = self.year_rollups.get(year)
+        if rollup is None:
+            keys = self.keys
+            months = keys[bisect_left(keys, year * 12):bisect_left(keys, year * 12 + 12)]
+            rollup = self.year_rollups[year] = Rollup.merge(self.month_rollup(month) for month in months)
+        return rollup
+
+    def _partial(self, month, low, high):
+        partial = Rollup()
+        for day, (categories, descriptions) in self.month_rollup(month).days.items():
+            if low <= day < high:
+                partial.include(categories, descriptions)
+        return partial
+
+    def _blocks(self, low, high):
+        """``(months, rollup)`` blocks covering days ``[low, high)``: a whole
+        year within the range as one block, otherwise one month at a time."""
+        keys = self.keys
+        if not keys:
+            return
+        index = bisect_left(keys, self._month(low)) if low < high else len(keys)
+        while index < len(keys):
+            key = keys[index]
+            start, end = first_day(key), first_day(key + 1)
+            if start >= high:
+                return
+            year = key // 12
+            if low <= first_day(year * 12) and first_day(year * 12 + 12) <= high:
+                stop = bisect_left(keys, year * 12 + 12)
+                yield keys[index:stop], self.year_rollup(year)
+                index = stop
+                continue
+            if low <= start and end <= high:
+                yield [key], self.month_rollup(key)
+            else:
+                yield [key], self._partial(key, max(low, start), min(high, end))
+            index += 1
+
+    # Queries
+
+    def month_totals(self, month, code=None):
+        """``[income, expense, count]`` in cents for the whole of ``month``."""
+        figures = self.month_rollup(month).categories
+        if code is not None:
+            return list(figures.get(code, (0, 0, 0)))
+        return _sum_figures(figures)
+
+    def report(self, start=None, end=None, category=None, top=10):
+        """Totals from ``start`` to ``end`` inclusive (dates at year, month
+        or day precision, or None for open ends): overall, by category, by
+        month with the change from the month before, and the ``top``
+        descriptions by spending."""
+        if len(start or '') > 10 or len(end or '') > 10:
+            raise ValueError('reports cover whole days')
+        low, high = period_bounds(start, end)
+        low = 1 if low is None else low // 86400 + EPOCH_ORDINAL
+        high = date.max.toordinal() if high is None else high // 86400 + EPOCH_ORDINAL
+        columns = self.columns
+        code = None
+        if category is not None:
+            code = columns.category_codes.get(category, -1)
+        categories = {}
+        months = []
+        descriptions = {}
+        for covered, rollup in self._blocks(low, high):
+            figures = rollup.categories
+            if code is not None:
+                figures = {code: figures[code]} if code in figures else {}
+            _merge_figures(categories, figures)
+            if len(covered) == 1:
+                months.append((covered[0], _sum_figures(figures)))
+            else:
+                # The months of a whole year are cached already
+                months.extend((month, self.month_totals(month, code)) for month in covered)
+            for (entry_code, key), (count, cents) in rollup.descriptions.items():
+                if code is not None and entry_code != code:
+                    continue
+                total = descriptions.get(key)
+                if total is None:
+                    descriptions[key] = [count, cents]
+                else:
+                    total[0] += count
+                    total[1] += cents
+        income, expense, count = _sum_figures(categories)
+        return {
+            'income': income / 100,
+            'expense': -expense / 100,
+            'net': (income + expense) / 100,
+            'count': count,
+            'categories': {
+                columns.category_names[entry_code]: _figures_dict(figures)
+                for entry_code, figures in sorted(categories.items())},
+            'months': self._month_series(months, code),
+            'top_descriptions': [
+                {'description': key, 'count': total[0], 'total': total[1] / 100}
+                for key, total in nsmallest(top, descriptions.items(), key=lambda item: item[1][1])
+                if total[1] < 0],
+        }
+
+    def _month_series(self, months, code):
+        series = []
+        if not months:
+            return series
+        by_month = dict(months)
+        first, last = months[0][0], months[-1][0]
+        previous = None
+        if first - 1 in self.month_rollups:
+            previous = _net(self.month_totals(first - 1, code))
+        # Months without transactions in between still count as zero
+        for month in range(first, last + 1):
+            figures = by_month.get(month, [0, 0, 0])
+            net = _net(figures)
+            entry = dict(_figures_dict(figures), month=month_label(month), change=None, change_pct=None)
+            if previous is not None:
+                entry['change'] = (net - previous) / 100
+                if previous:
+                    entry['change_pct'] = round((net - previous) * 100 / abs(previous), 1)
+            series.append(entry)
+            previous = net
+        return series
+
+
+def _sum_figures(figures):
+    total = [0, 0, 0]
+    for income, expense, count in figures.values():
+        total[0] += income
+        total[1] += expense
+        total[2] += count
+    return total
+
+
+def _net(figures):
+    return figures[0] + figures[1]
+
+
+def _figures_dict(figures):
+    income, expense, count = figures
+    return {'income': income / 100, 'expense': -expense / 100, 'net': (income + expense) / 100, 'count': count}
@@ -0,0 +1,359 @@
+import re
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge
+
+IDEA, TRANSACTION = 0, 1
+
+_WORD = re.compile(r'\w+')
+
+# Matches of each kind that a search counts into its facets
+MAX_COUNTED = 2000
+# Above this many records under its narrowest word, a query of several words
+# is checked record by record, newest first, rather than intersected whole
+MAX_INTERSECTED = 50000
+
+
+def tokenize(text):
+    return set(_WORD.findall(text.lower())) if text else set()
+
+
+def _idea_text(idea):
+    return '%s %s' % (idea.get('title') or '', idea.get('description') or '')
+
+
+class SearchIndex:
+    """Inverted index over idea titles and descriptions and transaction
+    descriptions, with the idea status or transaction category as facet.
+
+    Ideas and transactions have postings of their own, from a term to the
+    record ids containing it: a plain int for a term found in a single
+    record, which is most reference numbers, or else a sorted array of ids.
+    Searches walk them newest first, so a query matching most records still
+    stops early. The vocabulary is also kept sorted, which turns a prefix
+    into a contiguous range of terms found by bisection.
+    """
+
+    def __init__(self):
+        self.postings = ({}, {})
+        self.terms = []
+        self.facets = (Facets(), Facets())
+        # Postings as of the last freeze, whose arrays are shared with the
+        # copy being written out and so are copied before being changed
+        self._frozen = None
+
+    def __len__(self):
+        return len(self.facets[IDEA]) + len(self.facets[TRANSACTION])
+
+    # Maintenance
+
+    def add(self, kind, record_id, text, facet):
+        self.facets[kind][record_id] = facet
+        postings, other, terms = self.postings[kind], self.postings[1 - kind], self.terms
+        frozen = self._frozen[kind] if self._frozen is not None else None
+        for term in tokenize(text):
+            docs = postings.get(term)
+            if docs is None:
+                postings[term] = record_id
+                if terms is not None and term not in other:
+                    insort(terms, term)
+            elif isinstance(docs, int):
+                if docs != record_id:
+                    postings[term] = array('q', sorted((docs, record_id)))
+            else:
+                if frozen is not None and frozen.get(term) is docs:
+                    docs = postings[term] = array('q', docs)
+                if docs[-1] < record_id:
+                    docs.append(record_id)
+                else:
+                    i = bisect_left(docs, record_id)
+                    if docs[i] != record_id:
+                        docs.insert(i, record_id)
+
+    def remove(self, kind, record_id, text):
+        facets = self.facets[kind]
+        if record_id not in facets:
+            return
+        del facets[record_id]
+        postings, other = self.postings[kind], self.postings[1 - kind]
+        frozen = self._frozen[kind] if self._frozen is not None else None
+        for term in tokenize(text):
+            docs = postings.get(term)
+            if docs is None:
+                continue
+            if isinstance(docs, int):
+                if docs != record_id:
+                    continue
+                del postings[term]
+                if self.terms is not None and term not in other:
+                    del self.terms[bisect_left(self.terms, term)]
+                continue
+            i = bisect_left(docs, record_id)
+            if i == len(docs) or docs[i] != record_id:
+                continue
+            if len(docs) == 2:
+                postings[term] = docs[1 - i]
+            else:
+                if frozen is not None and frozen.get(term) is docs:
+                    docs = postings[term] = array('q', docs)
+                del docs[i]
+
+    def defer_terms(self):
+        """Stop keeping the vocabulary sorted until the next query, for bulk
+        loads: sorting once beats inserting a new term at a time."""
+        self.terms = None
+
+    def add_idea(self, idea):
+        self.add(IDEA, idea['id'], _idea_text(idea), idea.get('status'))
+
+    def remove_idea(self, idea):
+        self.remove(IDEA, idea['id'], _idea_text(idea))
+
+    def add_transaction(self, transaction):
+        self.add(TRANSACTION, transaction['id'], transaction.get('description'), transaction.get('category'))
+
+    def remove_transaction(self, transaction):
+        self.remove(TRANSACTION, transaction['id'], transaction.get('description'))
+
+    @classmethod
+    def build(cls, ideas, transactions):
+        """Index ``ideas`` (dicts) and ``transactions`` (a
+        :class:`columns.TransactionColumns`) from scratch."""
+        index = cls()
+        index.defer_terms()
+        for idea in ideas:
+            index.add_idea(idea)
+        for record_id, category, description in transactions.texts():
+            index.add(TRANSACTION, record_id, description, category)
+        return index
+
+    # Queries
+
+    def _prefixed(self, prefix):
+        if self.terms is None:
+            self.terms = sorted(self.postings[IDEA].keys() | self.postings[TRANSACTION].keys())
+        terms = self.terms
+        start = bisect_left(terms, prefix)
+        stop = bisect_left(terms, prefix + '\U0010ffff', start)
+        return terms[start:stop]
+
+    def matches(self, kind, words):
+        """Ids of the records of ``kind`` containing, for every one of
+        ``words``, a term starting with that word; newest first."""
+        postings = self.postings[kind]
+        groups = []
+        for word in words:
+            group = [postings[term] for term in self._prefixed(word) if term in postings]
+            if not group:
+                return ()
+            groups.append(group)
+        if len(groups) == 1:
+            return _newest_first(groups[0])
+        # Several words: intersect with the narrowest one's records, in C
+        # rather than looking each of them up, unless there are too many
+        groups.sort(key=_size)
+        if _size(groups[0]) > MAX_INTERSECTED:
+            return self._filtered(groups)
+        found = _union(groups[0])
+        for group in groups[1:]:
+            if len(found) * 16 < _size(group):
+                check = _contains(group)
+                found = {record_id for record_id in found if check(record_id)}
+            else:
+                found = set().union(*[found.intersection((docs,) if isinstance(docs, int) else docs) for docs in group])
+            if not found:
+                break
+        return sorted(found, reverse=True)
+
+    def _filtered(self, groups):
+        # Walks the narrowest word's records and checks the other words
+        checks = [_contains(group) for group in groups[1:]]
+        for record_id in _newest_first(groups[0]):
+            if all(check(record_id) for check in checks):
+                yield record_id
+
+    def search(self, query, status=None, category=None, limit=20, counted=MAX_COUNTED):
+        """Return ``(idea_ids, transaction_ids, facets, complete)`` for
+        ``query``.
+
+        Ids come newest first, at most ``limit`` of each. ``status`` keeps
+        only ideas with that status and ``category`` only transactions in
+        that category; naming just one of them drops the other kind. Facet
+        counts cover the newest ``counted`` matches of each kind, before those
+        filters; ``complete`` is False if that left some out.
+        """
+        words = tokenize(query)
+        found = ([], [])
+        counts = ({}, {})
+        complete = True
+        for kind, wanted, other in ((IDEA, status, category), (TRANSACTION, category, status)):
+            ids, kind_counts = found[kind], counts[kind]
+            values, codes = self.facets[kind].values, self.facets[kind].codes
+            # Only the facet counts are wanted of a kind the filters drop
+            dropped = wanted is None and other is not None
+            for n, record_id in enumerate(self.matches(kind, words) if words else ()):
+                value = values[codes[record_id]]
+                if n < counted:
+                    kind_counts[value] = kind_counts.get(value, 0) + 1
+                elif dropped or len(ids) == limit:
+                    complete = False
+                    break
+                if not dropped and len(ids) < limit and wanted in (None, value):
+                    ids.append(record_id)
+        facet_counts = {'status': counts[IDEA], 'category': counts[TRANSACTION]}
+        return found[IDEA], found[TRANSACTION], facet_counts, complete
+
+    # Snapshots
+
+    def freeze(self):
+        """Copy the index for a snapshot. Only the postings dicts and the
+        facets are copied, which is cheap enough for the store lock; the
+        arrays are shared until changed (copy on write). Returns a function
+        that encodes the copy, postings as arrays of keys ``id << 1 | kind``
+        and facets as the keys holding each value, meant for the snapshot
+        thread."""
+        frozen = self._frozen = (dict(self.postings[IDEA]), dict(self.postings[TRANSACTION]))
+        facets = (self.facets[IDEA].copy(), self.facets[TRANSACTION].copy())
+
+        def encode():
+            postings = {}
+            by_value = {}
+            for kind in (IDEA, TRANSACTION):
+                for term, docs in frozen[kind].items():
+                    keys = postings.get(term)
+                    if keys is None:
+                        keys = postings[term] = array('q')
+                    if isinstance(docs, int):
+                        keys.append(docs << 1 | kind)
+                    else:
+                        keys.extend([record_id << 1 | kind for record_id in docs])
+                for record_id, value in facets[kind].items():
+                    by_value.setdefault(value, array('q')).append(record_id << 1 | kind)
+            state = {'postings': postings, 'facets': [[value, keys] for value, keys in by_value.items()]}
+            # Written out; writers can change the arrays in place again
+            if self._frozen is frozen:
+                self._frozen = None
+            return state
+        return encode
+
+    @classmethod
+    def thaw(cls, state):
+        index = cls()
+        index.defer_terms()
+        ideas, transactions = index.postings
+        for term, keys in state['postings'].items():
+            if len(keys) == 1:
+                key = keys[0]
+                index.postings[key & 1][term] = key >> 1
+                continue
+            for kind_postings, kind in ((ideas, IDEA), (transactions, TRANSACTION)):
+                ids = sorted([key >> 1 for key in keys if key & 1 == kind])
+                if ids:
+                    kind_postings[term] = ids[0] if len(ids) == 1 else array('q', ids)
+        for value, keys in state['facets']:
+            for key in keys:
+                index.facets[key & 1][key >> 1] = value
+        return index
+
+
+class Facets:
+    """The facet value of each record of one kind, as a mapping from id to
+    value. Ids come from a counter, so values are kept as small codes in an
+    array indexed by id, rather than as a dict entry and an int each."""
+
+    def __init__(self):
+        self.values = []
+        self._code_of = {}
+        self.codes = array('h')
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, record_id):
+        return record_id < len(self.codes) and self.codes[record_id] >= 0
+
+    def __getitem__(self, record_id):
+        if record_id not in self:
+            raise KeyError(record_id)
+        return self.values[self.codes[record_id]]
+
+    def __setitem__(self, record_id, value):
+        code = self._code_of.get(value)
+        if code is None:
+            code = self._code_of[value] = len(self.values)
+            self.values.append(value)
+        codes = self.codes
+        if record_id >= len(codes):
+            codes.extend(array('h', [-1]) * (max(record_id + 1, len(codes) * 5 // 4) - len(codes)))
+        if codes[record_id] < 0:
+            self._len += 1
+        codes[record_id] = code
+
+    def __delitem__(self, record_id):
+        if record_id not in self:
+            raise KeyError(record_id)
+        self.codes[record_id] = -1
+        self._len -= 1
+
+    def items(self):
+        values = self.values
+        return ((record_id, values[code]) for record_id, code in enumerate(self.codes) if code >= 0)
+
+    def copy(self):
+        facets = Facets()
+        facets.values = list(self.values)
+        facets._code_of = dict(self._code_of)
+        facets.codes = self.codes[:]
+        facets._len = self._len
+        return facets
+
+
+def _size(group):
+    return sum(1 if isinstance(docs, int) else len(docs) for docs in group)
+
+
+def _union(group):
+    ids = set()
+    for docs in group:
+        if isinstance(docs, int):
+            ids.add(docs)
+        else:
+            ids.update(docs)
+    return ids
+
+
+def _newest_first(group):
+    if len(group) == 1:
+        docs = group[0]
+        return (docs,) if isinstance(docs, int) else reversed(docs)
+    return _distinct(merge(*[(docs,) if isinstance(docs, int) else reversed(docs) for docs in group], reverse=True))
+
+
+def _distinct(ids):
+    # Ids found under several terms come out repeatedly, next to each other
+    previous = None
+    for record_id in ids:
+        if record_id != previous:
+            yield record_id
+            previous = record_id
+
+
+def _contains(group):
+    """A test for whether an id is in any of the postings of ``group``."""
+    if len(group) > 8:
+        # Many terms, mostly held by few records each: one set beats
+        # searching every one of them
+        return _union(group).__contains__
+
+    def contains(record_id):
+        for docs in group:
+            if isinstance(docs, int):
+                if docs == record_id:
+                    return True
+            else:
+                i = bisect_left(docs, record_id)
+                if i < len(docs) and docs[i] == record_id:
+                    return True
+        return False
+    return contains
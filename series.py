@@ -0,0 +1,208 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from itertools import compress
+
+from aggregates import to_cents
+
+BUCKETS = ('day', 'week', 'month')
+
+# date(1970, 1, 1).toordinal(), for turning epoch seconds into day keys
+EPOCH_ORDINAL = 719163
+
+
+def bucket_key(bucket, value):
+    """Map a ``'%Y-%m-%d ...'`` date string to an ordered integer bucket key."""
+    year, month, day = int(value[0:4]), int(value[5:7]), int(value[8:10])
+    if bucket == 'month':
+        return year * 12 + month - 1
+    ordinal = date(year, month, day).toordinal()
+    if bucket == 'week':
+        return ordinal - date.fromordinal(ordinal).weekday()
+    return ordinal
+
+
+def _roll_up(bucket, day):
+    # Bucket key for the day with ordinal ``day``
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - (day - 1) % 7
+    value = date.fromordinal(day)
+    return value.year * 12 + value.month - 1
+
+
+def bucket_label(bucket, key):
+    if bucket == 'month':
+        return '%04d-%02d' % (key // 12, key % 12 + 1)
+    return date.fromordinal(key).isoformat()
+
+
+class BucketSeries:
+    """Net change and transaction count per bucket plus lazily maintained
+    prefix sums.
+
+    Changes to the newest bucket, the usual case, only touch the tail, so
+    the prefix sums stay valid; a change to an older bucket invalidates them
+    from that bucket on, and they are rebuilt from there on the next read.
+    A bucket whose last transaction is removed is dropped, so the buckets
+    are the same as a rebuild from the rows would give. Sizes are in
+    buckets, not transactions.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.net = array('q')
+        self.counts = array('q')
+        self.prefix = array('q')
+        self.valid = 0
+
+    def add(self, key, cents, count=1):
+        keys = self.keys
+        if keys and keys[-1] == key:
+            index = len(keys) - 1
+        else:
+            index = bisect_left(keys, key)
+            if index == len(keys) or keys[index] != key:
+                keys.insert(index, key)
+                self.net.insert(index, 0)
+                self.counts.insert(index, 0)
+        self.net[index] += cents
+        self.counts[index] += count
+        if not self.counts[index]:
+            del keys[index], self.net[index], self.counts[index]
+        self.valid = min(self.valid, index)
+
+    @classmethod
+    def from_totals(cls, totals):
+        """From ``{key: (net, count)}``."""
+        series = cls()
+        series.keys = sorted(totals)
+        series.net = array('q', (totals[key][0] for key in series.keys))
+        series.counts = array('q', (totals[key][1] for key in series.keys))
+        return series
+
+    def cumulative(self):
+        """Return ``(keys, running_totals)`` in cents."""
+        net, prefix = self.net, self.prefix
+        del prefix[self.valid:]
+        running = prefix[-1] if prefix else 0
+        for index in range(self.valid, len(net)):
+            running += net[index]
+            prefix.append(running)
+        self.valid = len(net)
+        return self.keys, prefix
+
+    def value_at(self, key):
+        """Running total at the end of bucket ``key``."""
+        keys, prefix = self.cumulative()
+        index = bisect_right(keys, key)
+        return prefix[index - 1] if index else 0
+
+
+class BalanceSeries:
+    """Running balance over time, overall and per category, for every
+    bucket size, maintained as transactions are added and removed."""
+
+    def __init__(self):
+        self.totals = {bucket: BucketSeries() for bucket in BUCKETS}
+        self.by_category = {bucket: {} for bucket in BUCKETS}
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build from a :class:`columns.TransactionColumns` in one pass over
+        the rows, grouping by day first and rolling days up into weeks and
+        months, rather than adding transactions one at a time."""
+        days = {}
+        for ts, cents, code in compress(zip(columns.timestamps, columns.cents, columns.codes), columns.alive):
+            key = (ts // 86400 + EPOCH_ORDINAL, code)
+            entry = days.get(key)
+            if entry is None:
+                days[key] = [cents, 1]
+            else:
+                entry[0] += cents
+                entry[1] += 1
+        series = cls()
+        for bucket in BUCKETS:
+            totals = {}
+            per_category = {}
+            for (day, code), (cents, count) in days.items():
+                key = _roll_up(bucket, day)
+                _add_total(totals, key, cents, count)
+                _add_total(per_category.setdefault(columns.category_names[code], {}), key, cents, count)
+            series.totals[bucket] = BucketSeries.from_totals(totals)
+            series.by_category[bucket] = {
+                category: BucketSeries.from_totals(values) for category, values in per_category.items()}
+        return series
+
+    def add_transaction(self, transaction, sign=1):
+        value = transaction.get('date')
+        if not value:
+            return
+        cents = sign * to_cents(transaction.get('amount', 0))
+        category = transaction.get('category')
+        day = bucket_key('day', value)
+        for bucket in BUCKETS:
+            key = _roll_up(bucket, day)
+            self.totals[bucket].add(key, cents, sign)
+            series = self.by_category[bucket].get(category)
+            if series is None:
+                series = self.by_category[bucket][category] = BucketSeries()
+            series.add(key, cents, sign)
+
+    def remove_transaction(self, transaction):
+        self.add_transaction(transaction, sign=-1)
+
+    def query(self, bucket, points=None, categories=()):
+        keys, totals = self.totals[bucket].cumulative()
+        indices = range(len(keys))
+        if points is not None and len(keys) > points:
+            indices = lttb(keys, totals, points)
+        result = {
+            'bucket': bucket,
+            'labels': [bucket_label(bucket, keys[i]) for i in indices],
+            'balance': [totals[i] / 100 for i in indices],
+            'categories': {},
+        }
+        for category in categories:
+            series = self.by_category[bucket].get(category) or BucketSeries()
+            result['categories'][category] = [series.value_at(keys[i]) / 100 for i in indices]
+        return result
+
+
+def _add_total(totals, key, cents, count):
+    entry = totals.get(key)
+    if entry is None:
+        totals[key] = [cents, count]
+    else:
+        entry[0] += cents
+        entry[1] += count
+
+
+def lttb(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of the points ``(xs, ys)``;
+    returns the indices of the ``threshold`` points that best keep its shape."""
+    count = len(ys)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+    every = (count - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        # Average of the following bucket is the third triangle vertex
+        span = range(end, next_end) if next_end > end else range(count - 1, count)
+        avg_x = sum(xs[j] for j in span) / len(span)
+        avg_y = sum(ys[j] for j in span) / len(span)
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(count - 1)
+    return selected
@@ -0,0 +1,410 @@
+import fcntl
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+SNAPSHOT_FORMAT = 5
+
+_decode = json.JSONDecoder().decode
+
+# Last line of a segment once a newer one has been started
+ROTATE = 'rotate'
+
+SEGMENT_NAME = 'journal-%08d.log'
+SUMMARY_NAME = 'summary'
+
+
+class StaleReader(Exception):
+    """The journal segment this process was about to read has already been
+    compacted away by another process; reload from the latest snapshot."""
+
+
+class JournalBackend:
+    """Append-only journal with grouped fsync and compacted snapshots.
+
+    Every committed operation is appended as one JSON line to the current
+    journal segment. A background thread fsyncs the segment every
+    ``flush_interval`` seconds, so request threads never wait on the disk
+    unless ``sync='group'`` is asked for. In that mode a writer waits for its
+    record to be durable, but all writers that arrive while an fsync is in
+    flight are covered together by the next one (group commit).
+
+    After ``snapshot_every`` operations the current segment is closed with a
+    rotate marker, the store state is written to ``snapshot-<n>.json`` on a
+    background thread and the segments it covers are removed. Startup loads
+    the newest snapshot and replays only the segments after it.
+
+    Several processes can share one journal directory. Writers serialise on
+    an exclusive ``flock`` of the ``lock`` file and :meth:`poll` whatever the
+    other processes appended before writing, so every process applies the
+    same operations in the same order. Readers catch up with :meth:`poll`.
+    """
+
+    def __init__(self, path, flush_interval=0.05, snapshot_every=10000, sync='interval'):
+        if sync not in ('interval', 'group', 'none'):
+            raise ValueError("sync must be 'interval', 'group' or 'none'")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.sync = sync
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._lock_fd = os.open(os.path.join(path, 'lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        self._locked = False
+        self._read_fd = None
+        self._read_segment = 0
+        self._read_offset = 0
+        self._write_fd = None
+        self._write_segment = None
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._syncing = False
+        self._since_snapshot = 0
+        self._snapshot_thread = None
+        self._closed = False
+        self._flusher = None
+        self._summary_fd = None
+
+    # Startup
+
+    def load(self):
+        """Return ``(state, ops)``: the newest snapshot (or None) and the
+        operations journaled after it. Called again to resync a stale reader."""
+        with self._shared_lock():
+            state = None
+            snapshots = self._numbered('snapshot-*.json', 9, -5)
+            if snapshots:
+                with open(self._snapshot_path(snapshots[-1]), 'rb') as f:
+                    state = json.load(f)
+                segment = state['segment']
+            else:
+                segment = (self._numbered('journal-*.log', 8, -4) or [0])[0]
+            self._open_reader(segment)
+        self._since_snapshot = 0
+        return state, self.poll()
+
+    def open(self):
+        """Start the background flusher; call once the initial load is applied."""
+        self._flusher = threading.Thread(target=self._flush_loop, name='journal-flusher', daemon=True)
+        self._flusher.start()
+
+    def _numbered(self, pattern, prefix, suffix):
+        names = glob.glob(os.path.join(self.path, pattern))
+        return sorted(int(os.path.basename(name)[prefix:suffix]) for name in names)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, SEGMENT_NAME % segment)
+
+    def _snapshot_path(self, segment):
+        return os.path.join(self.path, 'snapshot-%08d.json' % segment)
+
+    def _open_reader(self, segment):
+        if self._read_fd is not None:
+            os.close(self._read_fd)
+        self._read_fd = os.open(self._segment_path(segment), os.O_RDONLY | os.O_CREAT, 0o644)
+        self._read_segment = segment
+        self._read_offset = 0
+
+    # Cross-process locking
+
+    def lock(self):
+        """Take the exclusive writer lock. Callers must :meth:`poll` and apply
+        the result before appending, then :meth:`unlock`."""
+        flock(self._lock_fd, fcntl.LOCK_EX)
+        self._locked = True
+
+    def unlock(self):
+        self._locked = False
+        fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _shared_lock(self):
+        return _SharedLock(self)
+
+    # Reads
+
+    def poll(self):
+        """Return the complete operations appended since the last call."""
+        ops = []
+        while True:
+            size = os.fstat(self._read_fd).st_size
+            if size <= self._read_offset:
+                return ops
+            data = os.pread(self._read_fd, size - self._read_offset, self._read_offset)
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                # Only a partial line so far, or a torn write
+                return ops
+            rotated = False
+            for line in data[:end].splitlines(keepends=True):
+                self._read_offset += len(line)
+                op = _decode(line.decode('utf-8'))
+                if op['op'] == ROTATE:
+                    with self._shared_lock():
+                        if not os.path.exists(self._segment_path(op['segment'])):
+                            raise StaleReader(op['segment'])
+                        self._open_reader(op['segment'])
+                    self._since_snapshot = 0
+                    rotated = True
+                    break
+                self._since_snapshot += 1
+                ops.append(op)
+            if not rotated:
+                return ops
+
+    def position(self):
+        """``(segment, offset)`` just past the last operation read or written."""
+        return self._read_segment, self._read_offset
+
+    # Writes
+
+    def append(self, op):
+        """Journal ``op``. Only valid between :meth:`lock` and :meth:`unlock`."""
+        return self.append_many([op])
+
+    def append_many(self, ops):
+        """Journal ``ops`` with a single write; returns the sequence number
+        to pass to :meth:`wait_durable`."""
+        lines = b''.join(json.dumps(op, separators=(',', ':')).encode('utf-8') + b'\n' for op in ops)
+        with self._lock:
+            self._write(lines)
+            self._since_snapshot += len(ops)
+            self._written_seq += 1
+            return self._written_seq
+
+    def _write(self, line):
+        # Having polled under the exclusive lock, the reader sits at the end
+        # of the newest segment; any bytes past it are a torn write to drop.
+        if self._write_segment != self._read_segment:
+            self._reopen_writer(self._read_segment)
+        if os.fstat(self._write_fd).st_size != self._read_offset:
+            os.truncate(self._segment_path(self._write_segment), self._read_offset)
+        os.write(self._write_fd, line)
+        self._read_offset += len(line)
+
+    def _reopen_writer(self, segment):
+        while self._syncing:
+            self._synced.wait()
+        if self._write_fd is not None:
+            if self._synced_seq < self._written_seq and self.sync != 'none':
+                blocking(os.fsync, self._write_fd)
+            os.close(self._write_fd)
+        self._synced_seq = self._written_seq
+        self._synced.notify_all()
+        self._write_fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._write_segment = segment
+
+    def wait_durable(self, seq):
+        if self.sync != 'group':
+            return
+        with self._synced:
+            while self._synced_seq < seq and not self._closed:
+                if self._syncing:
+                    self._synced.wait()
+                else:
+                    # Become the leader: one fsync covers every append so far
+                    self._sync_locked()
+
+    def _flush_loop(self):
+        while not self._closed:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            while self._syncing:
+                self._synced.wait()
+            if self._write_fd is not None and self._synced_seq < self._written_seq:
+                self._sync_locked()
+
+    def _sync_locked(self):
+        # Called with the lock held; drops it around the fsync so that other
+        # threads can keep appending into the next group meanwhile.
+        self._syncing = True
+        target, fd = self._written_seq, self._write_fd
+        self._lock.release()
+        try:
+            if self.sync != 'none':
+                blocking(os.fsync, fd)
+        finally:
+            self._lock.acquire()
+            self._syncing = False
+            self._synced_seq = max(self._synced_seq, target)
+            self._synced.notify_all()
+
+    # Snapshots
+
+    def wants_snapshot(self):
+        return self._since_snapshot >= self.snapshot_every and not self.snapshot_running()
+
+    def snapshot_running(self):
+        return self._snapshot_thread is not None and self._snapshot_thread.is_alive()
+
+    def start_snapshot(self, state):
+        """Rotate to a fresh segment and write ``state`` in the background.
+
+        Must be called holding both the store lock and the writer lock, so
+        that ``state`` matches exactly the operations before the rotation.
+        Values of ``state`` that are functions are called on the snapshot
+        thread, which keeps costly encoding out of those locks.
+        """
+        segment = self._read_segment + 1
+        with self._lock:
+            self._write(json.dumps({'op': ROTATE, 'segment': segment}).encode('utf-8') + b'\n')
+            self._reopen_writer(segment)
+        self._open_reader(segment)
+        self._since_snapshot = 0
+        self._snapshot_thread = threading.Thread(
+            target=self._write_snapshot, args=(state, segment), name='journal-snapshot', daemon=True)
+        self._snapshot_thread.start()
+
+    def _write_snapshot(self, state, segment):
+        blocking(self._save_snapshot, state, segment)
+        # A descriptor of our own, so this waits for writers in this process
+        # as well instead of sharing (and then releasing) their lock
+        lock_fd = os.open(os.path.join(self.path, 'lock'), os.O_RDWR)
+        try:
+            flock(lock_fd, fcntl.LOCK_EX)
+            for old in self._numbered('journal-*.log', 8, -4):
+                if old < segment:
+                    os.remove(self._segment_path(old))
+            for old in self._numbered('snapshot-*.json', 9, -5):
+                if old < segment:
+                    os.remove(self._snapshot_path(old))
+        finally:
+            os.close(lock_fd)
+
+    def _save_snapshot(self, state, segment):
+        # Parts of the state may be deferred as functions, so that encoding
+        # them happens here rather than under the locks held by the caller
+        state = {key: value() if callable(value) else value for key, value in state.items()}
+        state.update(format=SNAPSHOT_FORMAT, segment=segment)
+        final_path = self._snapshot_path(segment)
+        tmp_path = '%s.%d.tmp' % (final_path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, separators=(',', ':'), default=encode)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
+
+    # Summaries
+
+    def write_summary(self, figures):
+        """Overwrite the summary file with ``figures`` and the current
+        position, for :func:`read_summary`. Only valid between :meth:`lock`
+        and :meth:`unlock`, so the newest summary always matches the journal.
+        Readers take no lock: the file is rewritten in place behind a header
+        with the length and checksum of the rest, so a half-written one is
+        recognised and read again."""
+        if self._summary_fd is None:
+            self._summary_fd = os.open(os.path.join(self.path, SUMMARY_NAME), os.O_WRONLY | os.O_CREAT, 0o644)
+        body = json.dumps(dict(figures, position=self.position()), separators=(',', ':')).encode('utf-8')
+        data = b'%d %d\n' % (len(body), zlib.crc32(body)) + body
+        os.pwrite(self._summary_fd, data, 0)
+        os.ftruncate(self._summary_fd, len(data))
+
+    def close(self):
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self.flush()
+        with self._lock:
+            while self._syncing:
+                self._synced.wait()
+            self._closed = True
+            self._synced.notify_all()
+            for fd in (self._write_fd, self._read_fd, self._lock_fd, self._summary_fd):
+                if fd is not None:
+                    os.close(fd)
+            self._write_fd = self._read_fd = self._lock_fd = self._summary_fd = None
+
+
+def read_summary(path, attempts=5):
+    """``(figures, position)`` as :meth:`JournalBackend.write_summary` last
+    wrote them for the journal in ``path``, read without loading it or
+    taking its lock. None if there are none, or if they are out of date,
+    e.g. when a process died between journaling and writing them."""
+    for attempt in range(attempts):
+        if attempt:
+            # A writer is between its two writes, or halfway through one
+            time.sleep(0.001 * attempt)
+        try:
+            with open(os.path.join(path, SUMMARY_NAME), 'rb') as f:
+                data = f.read()
+            head, _, body = data.partition(b'\n')
+            length, checksum = map(int, head.split())
+            body = body[:length]
+            if len(body) != length or zlib.crc32(body) != checksum:
+                continue
+            figures = json.loads(body.decode('utf-8'))
+            segment, offset = figures.pop('position')
+            if os.path.getsize(os.path.join(path, SEGMENT_NAME % segment)) == offset:
+                return figures, (segment, offset)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def flock(fd, operation):
+    """``fcntl.flock(fd, operation)``, waiting for other holders of the lock.
+
+    Under gevent the wait polls without blocking, sleeping in between, instead
+    of going to a thread from gevent's pool: the holder of the lock may need
+    one of those threads itself, e.g. to fsync, before it can let go."""
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is None or not monkey.is_module_patched('threading'):
+        return fcntl.flock(fd, operation)
+    delay = 0.0005
+    while True:
+        try:
+            return fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+
+
+def blocking(fn, *args):
+    """Call ``fn(*args)``, which may wait on the disk. Under gevent's monkey
+    patching, threads are greenlets sharing one OS thread, and such a call
+    would stall every request of the worker; it runs on a real thread from
+    gevent's pool instead. Never wait for a lock this way: see :func:`flock`."""
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from gevent import get_hub
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def encode(value):
+    """JSON fallback for columnar snapshot state: arrays become lists and
+    byte strings latin-1 text, which round-trips every byte value."""
+    if isinstance(value, array):
+        return value.tolist()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('latin-1')
+    raise TypeError('cannot encode %r' % type(value))
+
+
+class _SharedLock:
+    # Shared flock that is a no-op while this process holds the writer lock;
+    # taking it then would silently downgrade the exclusive lock.
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.taken = False
+
+    def __enter__(self):
+        if not self.backend._locked:
+            flock(self.backend._lock_fd, fcntl.LOCK_SH)
+            self.taken = True
+
+    def __exit__(self, *exc):
+        if self.taken:
+            fcntl.flock(self.backend._lock_fd, fcntl.LOCK_UN)
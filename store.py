@@ -0,0 +1,465 @@
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+
+from aggregates import Aggregates
+from columns import TransactionColumns, transaction_fingerprint
+from reports import Reports
+from search import SearchIndex
+from series import BalanceSeries
+from storage import StaleReader
+
+
+class Table:
+    """Records keyed by a stable integer ``id``, kept in insertion order.
+
+    Deleting leaves a tombstone (None) in place of the row, so no other row
+    moves; :meth:`compact` squeezes the tombstones out once there are enough
+    of them to matter.
+    """
+
+    def __init__(self, records=(), next_id=1):
+        self.rows = []
+        # Row ids in position order, tombstones included, for bisecting cursors
+        self.ids = array('q')
+        self.positions = {}
+        self.next_id = next_id
+        self.tombstones = 0
+        for record in records:
+            self.insert(record)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return (row for row in self.rows if row is not None)
+
+    def get(self, record_id):
+        position = self.positions.get(record_id)
+        return None if position is None else self.rows[position]
+
+    def insert(self, record):
+        record_id = record['id']
+        self.positions[record_id] = len(self.rows)
+        self.rows.append(record)
+        self.ids.append(record_id)
+        self.next_id = max(self.next_id, record_id + 1)
+
+    def replace(self, record):
+        position = self.positions.get(record['id'])
+        if position is None:
+            return None
+        old = self.rows[position]
+        self.rows[position] = record
+        return old
+
+    def remove(self, record_id):
+        position = self.positions.pop(record_id, None)
+        if position is None:
+            return None
+        old = self.rows[position]
+        self.rows[position] = None
+        self.tombstones += 1
+        return old
+
+    def pop(self, next_id):
+        """Undo the last :meth:`insert`, putting ``next_id`` back."""
+        record = self.rows.pop()
+        self.ids.pop()
+        del self.positions[record['id']]
+        self.next_id = next_id
+
+    def restore(self, record):
+        """Undo :meth:`remove` of ``record``."""
+        position = bisect_left(self.ids, record['id'])
+        self.rows[position] = record
+        self.positions[record['id']] = position
+        self.tombstones -= 1
+
+    def page(self, cursor=None, limit=50, match=None):
+        """Return up to ``limit`` records newest first, starting just below
+        the id ``cursor``, plus the cursor for the following page (or None).
+        ``match`` optionally filters records."""
+        position = len(self.rows) if cursor is None else bisect_left(self.ids, cursor)
+        rows = self.rows
+        items = []
+        while position > 0 and len(items) < limit:
+            position -= 1
+            row = rows[position]
+            if row is not None and (match is None or match(row)):
+                items.append(row)
+        next_cursor = items[-1]['id'] if len(items) == limit and position > 0 else None
+        return items, next_cursor
+
+    def needs_compaction(self):
+        return self.tombstones >= 1024 and self.tombstones * 4 >= len(self.rows)
+
+    def compact(self):
+        self.rows = [row for row in self.rows if row is not None]
+        self.ids = array('q', (row['id'] for row in self.rows))
+        self.positions = {row['id']: position for position, row in enumerate(self.rows)}
+        self.tombstones = 0
+
+
+class Store:
+    """Ideas and transactions plus everything derived from them.
+
+    All mutations go through :meth:`commit` as small operation dicts, which
+    are applied in memory, handed to the persistence backend and replayed
+    from it on the next start. When several processes share a backend,
+    :meth:`refresh` applies what the others have committed meanwhile.
+    """
+
+    def __init__(self, categories, idea_statuses, backend=None):
+        self.categories = categories
+        self.idea_statuses = idea_statuses
+        self.backend = backend
+        self.lock = threading.RLock()
+        self.version = 0
+        # Called under the lock with the (op, result) pairs of each commit or
+        # catch-up, in order, or with None when the store had to be reloaded
+        self.on_change = None
+        self._changes = []
+        self._compactor = None
+        self._reset()
+        if backend is not None:
+            self._load()
+
+    def _reset(self, ideas=(), transactions=(), next_ids=None, search=None, reports=None):
+        next_ids = next_ids or {}
+        self.ideas = Table(ideas, next_ids.get('ideas', 1))
+        if isinstance(transactions, dict):
+            self.transactions = TransactionColumns.thaw(self.categories, transactions, next_ids.get('transactions', 1))
+        else:
+            self.transactions = TransactionColumns(self.categories, transactions, next_ids.get('transactions', 1))
+        self._rebuild_views()
+        # The search index and report rollups are persisted with snapshots;
+        # older ones lack them
+        if search is None:
+            self.search = SearchIndex.build(self.ideas, self.transactions)
+        else:
+            self.search = SearchIndex.thaw(search)
+        if reports is None:
+            self.reports = Reports.build(self.transactions)
+        else:
+            self.reports = Reports.thaw(self.transactions, reports)
+
+    def _rebuild_views(self):
+        self.aggregates = Aggregates(self.categories, self.idea_statuses)
+        for idea in self.ideas:
+            self.aggregates.add_idea(idea)
+        # Transaction views are rebuilt from whole columns rather than row by row
+        self.aggregates.load_transactions(self.transactions)
+        self.series = BalanceSeries.from_columns(self.transactions)
+        # Duplicate detection for imports, built on first use
+        self.fingerprints = None
+
+    def _load(self):
+        self._resync()
+        self.backend.open()
+
+    def _resync(self):
+        state, ops = self.backend.load()
+        if state is None:
+            self._reset()
+        else:
+            self._reset(state['ideas'], state['transactions'], state['next_ids'], state.get('search'),
+                        state.get('reports'))
+        # Replay into the tables, the search index and the report rollups
+        # alone and derive the other views once at the end; updating them op
+        # by op makes a long journal replay several times slower
+        self.search.defer_terms()
+        for op in ops:
+            self._apply_to_tables(op)
+        if ops:
+            self._rebuild_views()
+        self.version += 1
+
+    def _apply_all(self, ops):
+        for op in ops:
+            result = self.apply(op)
+            if result is not None:
+                self.version += 1
+                self._changed(op, result)
+
+    def refresh(self):
+        """Catch up with operations committed by other processes."""
+        if self.backend is None:
+            return
+        with self.lock:
+            self._catch_up()
+            self._publish()
+
+    def _catch_up(self):
+        try:
+            self._apply_all(self.backend.poll())
+        except StaleReader:
+            self._resync()
+            # What changed is unknown after a reload
+            self._changes = None
+
+    def position(self):
+        """Where this store is in the shared journal; the same value means
+        the same state in every process."""
+        if self.backend is None:
+            return 0, self.version
+        return self.backend.position()
+
+    def _changed(self, op, result):
+        if self.on_change is not None and self._changes is not None:
+            self._changes.append((op, result))
+
+    def _publish(self):
+        changes, self._changes = self._changes, []
+        if self.on_change is not None and changes != []:
+            self.on_change(changes)
+
+    # Mutations
+
+    def add_idea(self, idea):
+        return self.commit({'op': 'add_idea', 'record': idea})
+
+    def add_transaction(self, transaction):
+        return self.commit({'op': 'add_transaction', 'record': transaction})
+
+    def update_idea(self, idea_id, changes):
+        return self.commit({'op': 'update_idea', 'id': idea_id, 'changes': changes})
+
+    def delete_idea(self, idea_id):
+        return self.commit({'op': 'delete_idea', 'id': idea_id})
+
+    def delete_transaction(self, transaction_id):
+        return self.commit({'op': 'delete_transaction', 'id': transaction_id})
+
+    def import_transactions(self, transactions):
+        """Add, as one batch, those of ``transactions`` that are not already
+        stored with the same date, amount and description (or earlier in the
+        batch). Returns one record per transaction, None for duplicates."""
+        ops = [{'op': 'add_transaction', 'record': transaction} for transaction in transactions]
+        return self.commit_many(ops, keep=self._is_new_transaction)
+
+    def _is_new_transaction(self, op):
+        if self.fingerprints is None:
+            self.fingerprints = {}
+            for key in self.transactions.fingerprints():
+                self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+        return transaction_fingerprint(op['record']) not in self.fingerprints
+
+    def commit(self, op):
+        """Apply ``op`` and journal it. Returns the affected record, or None
+        if the operation was a no-op (in which case nothing is journaled)."""
+        return self.commit_many([op])[0]
+
+    def commit_many(self, ops, keep=None):
+        """Apply and journal several operations under one lock acquisition,
+        waiting for durability once at the end. Returns one result per op.
+        ``keep(op)``, checked just before each op is applied, can veto it."""
+        results = []
+        journal = []
+        seq = None
+        with self.lock:
+            if self.backend is not None:
+                self.backend.lock()
+            try:
+                if self.backend is not None:
+                    self._catch_up()
+                for op in ops:
+                    if keep is not None and not keep(op):
+                        results.append(None)
+                        continue
+                    op = self._assign_id(op)
+                    result = self.apply(op)
+                    results.append(result)
+                    if result is None:
+                        continue
+                    self.version += 1
+                    self._changed(op, result)
+                    journal.append(op)
+            finally:
+                if self.backend is not None:
+                    # Journaled in one write, including whatever was applied
+                    # before an op failed, so memory never gets ahead of disk
+                    try:
+                        if journal:
+                            seq = self.backend.append_many(journal)
+                            if self.backend.wants_snapshot():
+                                self.backend.start_snapshot(self.snapshot_state())
+                            self.backend.write_summary(self.aggregates.figures())
+                    finally:
+                        self.backend.unlock()
+            self._publish()
+            if self.ideas.needs_compaction() or self.transactions.needs_compaction():
+                self._start_compaction()
+        if seq is not None:
+            self.backend.wait_durable(seq)
+        return results
+
+    def save_summary(self):
+        """Catch up and write the summary other processes read instead of
+        loading this store, e.g. for a journal from before summaries were
+        kept. Returns ``(figures, position)`` as :func:`storage.read_summary`
+        does."""
+        with self.lock:
+            self.backend.lock()
+            try:
+                self._catch_up()
+                figures = self.aggregates.figures()
+                self.backend.write_summary(figures)
+                position = self.backend.position()
+            finally:
+                self.backend.unlock()
+            self._publish()
+        return figures, position
+
+    def _assign_id(self, op):
+        # Ids are fixed before journaling so that replay reproduces them
+        kind = op['op']
+        if kind == 'add_idea' and 'id' not in op['record']:
+            return dict(op, record=dict(op['record'], id=self.ideas.next_id))
+        if kind == 'add_transaction' and 'id' not in op['record']:
+            return dict(op, record=dict(op['record'], id=self.transactions.next_id))
+        return op
+
+    def apply(self, op):
+        kind = op['op']
+        if kind == 'add_idea':
+            idea = op['record']
+            next_id = self.ideas.next_id
+            self.ideas.insert(idea)
+            with self._undo_on_error(lambda: self.ideas.pop(next_id)):
+                self._idea_added(idea)
+            return idea
+        if kind == 'add_transaction':
+            next_id = self.transactions.next_id
+            self.transactions.insert(op['record'])
+            with self._undo_on_error(lambda: self.transactions.pop(next_id)):
+                transaction = self.transactions.get(op['record']['id'])
+                self._transaction_added(transaction)
+            return transaction
+        if kind == 'update_idea':
+            old = self.ideas.get(op['id'])
+            if old is None:
+                return None
+            # Replace rather than mutate: snapshots share record dicts
+            idea = dict(old, **op['changes'], id=old['id'])
+            self.ideas.replace(idea)
+            with self._undo_on_error(lambda: self.ideas.replace(old)):
+                self._idea_removed(old)
+                self._idea_added(idea)
+            return idea
+        if kind == 'delete_idea':
+            idea = self.ideas.remove(op['id'])
+            if idea is not None:
+                with self._undo_on_error(lambda: self.ideas.restore(idea)):
+                    self._idea_removed(idea)
+            return idea
+        if kind == 'delete_transaction':
+            transaction = self.transactions.remove(op['id'])
+            if transaction is not None:
+                with self._undo_on_error(lambda: self.transactions.restore(op['id'])):
+                    self._transaction_removed(transaction)
+            return transaction
+        raise ValueError('unknown operation %r' % kind)
+
+    @contextmanager
+    def _undo_on_error(self, undo):
+        # A view that raises part way through leaves the views out of step
+        # with the tables. The table change is undone and the views derived
+        # again, so a failed op leaves memory as it was, and as journaled
+        try:
+            yield
+        except Exception:
+            undo()
+            self._rebuild_views()
+            self.search = SearchIndex.build(self.ideas, self.transactions)
+            self.reports = Reports.build(self.transactions)
+            raise
+
+    def _apply_to_tables(self, op):
+        kind = op['op']
+        search = self.search
+        if kind == 'add_idea':
+            self.ideas.insert(op['record'])
+            search.add_idea(op['record'])
+        elif kind == 'add_transaction':
+            self.transactions.insert(op['record'])
+            search.add_transaction(op['record'])
+            self.reports.add_transaction(op['record'])
+        elif kind == 'update_idea':
+            old = self.ideas.get(op['id'])
+            if old is not None:
+                idea = dict(old, **op['changes'], id=old['id'])
+                self.ideas.replace(idea)
+                search.remove_idea(old)
+                search.add_idea(idea)
+        elif kind == 'delete_idea':
+            idea = self.ideas.remove(op['id'])
+            if idea is not None:
+                search.remove_idea(idea)
+        elif kind == 'delete_transaction':
+            transaction = self.transactions.remove(op['id'])
+            if transaction is not None:
+                search.remove_transaction(transaction)
+                self.reports.remove_transaction(transaction)
+        else:
+            raise ValueError('unknown operation %r' % kind)
+
+    # Derived views, updated incrementally as records come and go
+
+    def _idea_added(self, idea):
+        self.aggregates.add_idea(idea)
+        self.search.add_idea(idea)
+
+    def _idea_removed(self, idea):
+        self.aggregates.remove_idea(idea)
+        self.search.remove_idea(idea)
+
+    def _transaction_added(self, transaction):
+        self.aggregates.add_transaction(transaction)
+        self.series.add_transaction(transaction)
+        self.reports.add_transaction(transaction)
+        self.search.add_transaction(transaction)
+        if self.fingerprints is not None:
+            key = transaction_fingerprint(transaction)
+            self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+
+    def _transaction_removed(self, transaction):
+        self.aggregates.remove_transaction(transaction)
+        self.series.remove_transaction(transaction)
+        self.reports.remove_transaction(transaction)
+        self.search.remove_transaction(transaction)
+        if self.fingerprints is not None:
+            key = transaction_fingerprint(transaction)
+            if self.fingerprints[key] > 1:
+                self.fingerprints[key] -= 1
+            else:
+                del self.fingerprints[key]
+
+    def _start_compaction(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact, name='store-compactor', daemon=True)
+        self._compactor.start()
+
+    def _compact(self):
+        with self.lock:
+            for table in (self.ideas, self.transactions):
+                if table.needs_compaction():
+                    table.compact()
+
+    # Persistence
+
+    def snapshot_state(self):
+        # Idea records are never mutated in place, so a shallow copy is enough
+        return {
+            'ideas': list(self.ideas),
+            'transactions': self.transactions.freeze(),
+            'search': self.search.freeze(),
+            'reports': self.reports.freeze(),
+            'next_ids': {'ideas': self.ideas.next_id, 'transactions': self.transactions.next_id},
+        }
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
@@ -0,0 +1,191 @@
+"""Journal, rotation and multi-process catch-up of a journaled Store."""
+import glob
+import os
+import time
+
+import pytest
+
+from storage import SEGMENT_NAME, JournalBackend
+from store import Store
+
+CATEGORIES = ["Personal", "Business", "Investment", "Savings"]
+IDEA_STATUSES = ["New", "In Progress", "Completed", "On Hold"]
+
+
+def open_store(path, **options):
+    return Store(CATEGORIES, IDEA_STATUSES, backend=JournalBackend(str(path), **options))
+
+
+def add_transaction(store, amount, day=1, description='coffee'):
+    return store.add_transaction({'amount': amount, 'category': 'Business', 'description': description,
+                                  'date': '2024-03-%02d 12:00' % day})
+
+
+def add_idea(store, title, status='New'):
+    return store.add_idea({'title': title, 'description': 'idea ' + title, 'status': status,
+                           'created_at': '2024-03-01T12:00:00'})
+
+
+def state(store):
+    """Everything a client can read from the store, for comparing two."""
+    with store.lock:
+        return {
+            'ideas': list(store.ideas),
+            'transactions': list(store.transactions),
+            'next_ids': (store.ideas.next_id, store.transactions.next_id),
+            'aggregates': store.aggregates.to_dict(),
+            'series': store.series.query('day', None, CATEGORIES),
+            'reports': store.reports.report(None, None),
+            'search': store.search.search('co', limit=1000)[:3],
+        }
+
+
+def wait_for_snapshot(store):
+    while store.backend.snapshot_running():
+        time.sleep(0.01)
+
+
+def churn(store, count, first_day=1):
+    """A mix of adds, updates and deletes."""
+    for i in range(count):
+        transaction = add_transaction(store, i - count // 2, first_day + i % 20, 'coffee #%d' % i)
+        idea = add_idea(store, 'cook %d' % i)
+        if i % 3 == 0:
+            store.delete_transaction(transaction['id'])
+        if i % 4 == 0:
+            store.update_idea(idea['id'], {'status': 'Completed'})
+        if i % 5 == 0:
+            store.delete_idea(idea['id'])
+
+
+def test_replay_after_restart(tmp_path):
+    store = open_store(tmp_path)
+    churn(store, 30)
+    expected = state(store)
+    store.close()
+
+    reopened = open_store(tmp_path)
+    try:
+        assert state(reopened) == expected
+        # Ids carry on where they left off
+        assert add_transaction(reopened, 1)['id'] == expected['next_ids'][1]
+    finally:
+        reopened.close()
+
+
+def test_snapshot_plus_tail_matches_memory(tmp_path):
+    store = open_store(tmp_path, snapshot_every=25)
+    churn(store, 40)
+    wait_for_snapshot(store)
+    # Some operations after the newest snapshot
+    churn(store, 7, first_day=5)
+    expected = state(store)
+    store.close()
+
+    assert glob.glob(str(tmp_path / 'snapshot-*.json'))
+    segment, offset = store.backend.position()
+    assert offset > 0
+    reopened = open_store(tmp_path, snapshot_every=25)
+    try:
+        assert state(reopened) == expected
+    finally:
+        reopened.close()
+
+
+def test_stores_interleaving_commits(tmp_path):
+    first = open_store(tmp_path)
+    second = open_store(tmp_path)
+    try:
+        a = add_transaction(first, 10)
+        b = add_transaction(second, 20)
+        assert a['id'] != b['id']
+        # Each one catches up under the writer lock before writing
+        assert second.delete_transaction(a['id']) is not None
+        idea = add_idea(first, 'plan')
+        assert second.update_idea(idea['id'], {'status': 'On Hold'})['status'] == 'On Hold'
+        for i in range(20):
+            add_transaction(first if i % 2 else second, i, description='taxi %d' % i)
+        first.refresh()
+        second.refresh()
+        assert state(first) == state(second)
+        assert first.position() == second.position()
+
+        third = open_store(tmp_path)
+        try:
+            assert state(third) == state(first)
+        finally:
+            third.close()
+    finally:
+        first.close()
+        second.close()
+
+
+def test_reader_behind_two_rotations_resyncs(tmp_path):
+    writer = open_store(tmp_path, snapshot_every=5)
+    reader = open_store(tmp_path, snapshot_every=5)
+    changes = []
+    reader.on_change = changes.append
+    try:
+        add_transaction(writer, 1)
+        reader.refresh()
+        for rotation in range(2):
+            for i in range(5):
+                add_transaction(writer, i, description='rotation %d' % rotation)
+            wait_for_snapshot(writer)
+        # The reader's next segment has been compacted away meanwhile
+        assert not os.path.exists(os.path.join(str(tmp_path), SEGMENT_NAME % 1))
+        reader.refresh()
+        assert state(reader) == state(writer)
+        assert reader.position() == writer.position()
+        # Reloaded, so what changed is unknown
+        assert changes[-1] is None
+        # And it keeps following the writer afterwards
+        add_transaction(writer, 99)
+        reader.refresh()
+        assert state(reader) == state(writer)
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_torn_final_line_is_dropped(tmp_path):
+    store = open_store(tmp_path)
+    for i in range(5):
+        add_transaction(store, i)
+    expected = state(store)
+    segment, offset = store.backend.position()
+    store.close()
+
+    # A write cut short by a crash: part of a line, no newline
+    with open(os.path.join(str(tmp_path), SEGMENT_NAME % segment), 'ab') as f:
+        f.write(b'{"op":"add_transaction","record":{"amou')
+
+    reopened = open_store(tmp_path)
+    try:
+        assert state(reopened) == expected
+        # The next commit overwrites the torn bytes
+        added = add_transaction(reopened, 7)
+        assert os.path.getsize(os.path.join(str(tmp_path), SEGMENT_NAME % segment)) == reopened.position()[1]
+        expected = state(reopened)
+    finally:
+        reopened.close()
+
+    again = open_store(tmp_path)
+    try:
+        assert state(again) == expected
+        assert again.transactions.get(added['id']) is not None
+    finally:
+        again.close()
+
+
+@pytest.mark.parametrize('sync', ['interval', 'group', 'none'])
+def test_sync_modes_replay(tmp_path, sync):
+    store = open_store(tmp_path, sync=sync)
+    churn(store, 5)
+    expected = state(store)
+    store.close()
+    reopened = open_store(tmp_path, sync=sync)
+    try:
+        assert state(reopened) == expected
+    finally:
+        reopened.close()
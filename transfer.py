@@ -0,0 +1,263 @@
+import codecs
+import csv
+import io
+import json
+import re
+from datetime import datetime
+
+from aggregates import valid_amount
+
+FORMATS = ('csv', 'jsonl', 'ofx')
+FIELDS = ('date', 'amount', 'category', 'description')
+
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.ofx': 'ofx', '.qfx': 'ofx'}
+
+# Column headers recognised for each field when no explicit mapping is given
+HEADERS = {
+    'date': ('date', 'posted', 'posting date', 'booking date', 'transaction date', 'value date'),
+    'amount': ('amount', 'value', 'sum', 'total'),
+    'category': ('category', 'type'),
+    'description': ('description', 'memo', 'payee', 'name', 'details', 'narrative', 'reference'),
+}
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+DECIMALS = ('.', ',')
+_AMOUNT_JUNK = re.compile(r'[^0-9.,\-+]')
+# With each decimal mark, the other one may only separate groups of thousands
+_GROUPED = {
+    '.': re.compile(r'[+-]?\d{1,3}(,\d{3})+(\.\d*)?$'),
+    ',': re.compile(r'[+-]?\d{1,3}(\.\d{3})+(,\d*)?$'),
+}
+_DIGITS = re.compile(r'\d+')
+
+
+class RowError(ValueError):
+    """A row that cannot be turned into a transaction; the import skips it."""
+
+
+def detect_format(filename, content_type=None):
+    for extension, fmt in EXTENSIONS.items():
+        if filename and filename.lower().endswith(extension):
+            return fmt
+    if content_type and 'csv' in content_type:
+        return 'csv'
+    return None
+
+
+def text_stream(binary):
+    """Decode a binary upload as UTF-8 (BOM or not) a buffer at a time."""
+    if isinstance(binary, io.RawIOBase):
+        binary = io.BufferedReader(binary)
+    if isinstance(binary, io.BufferedIOBase):
+        return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+    # SpooledTemporaryFile is no io class before Python 3.11
+    return codecs.getreader('utf-8-sig')(binary)
+
+
+# Readers: each yields ``(line, fields)`` with raw string fields, one
+# transaction at a time, never holding more than the current record
+
+def read_csv(stream, mapping=None):
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = _columns(header, mapping or {})
+    for row in reader:
+        if not any(row):
+            continue
+        yield reader.line_num, {field: row[index] if index < len(row) else '' for field, index in columns.items()}
+
+
+def _columns(header, mapping):
+    names = [name.strip().lower() for name in header]
+    columns = {}
+    for field in FIELDS:
+        wanted = mapping.get(field)
+        candidates = (wanted.strip().lower(),) if wanted else HEADERS[field]
+        for candidate in candidates:
+            if candidate in names:
+                columns[field] = names.index(candidate)
+                break
+        else:
+            if wanted or field in ('date', 'amount'):
+                raise ValueError('no %s column (headers: %s); map one with %s_column=<header>'
+                                 % (field, ', '.join(header), field))
+    return columns
+
+
+def read_jsonl(stream, mapping=None):
+    mapping = mapping or {}
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None
+            continue
+        yield line_number, {field: record.get(mapping.get(field) or field) for field in FIELDS}
+
+
+def read_ofx(stream, mapping=None):
+    """Statement transactions from OFX 1.x (SGML, unclosed tags) or 2.x (XML)."""
+    record = None
+    number = 0
+    for tag, value in _ofx_tokens(stream):
+        # Some banks leave STMTTRN itself unclosed, too
+        if record is not None and tag in ('STMTTRN', '/STMTTRN', '/BANKTRANLIST'):
+            number += 1
+            yield number, _ofx_fields(record)
+            record = None
+        if tag == 'STMTTRN':
+            record = {}
+        elif record is not None and value:
+            record[tag] = value
+
+
+def _ofx_fields(record):
+    name, memo = record.get('NAME', ''), record.get('MEMO', '')
+    return {
+        'date': record.get('DTPOSTED', ''),
+        'amount': record.get('TRNAMT', ''),
+        'category': None,
+        'description': name if not memo or memo == name else ('%s %s' % (name, memo)).strip(),
+    }
+
+
+def _ofx_tokens(stream):
+    # Yields (TAG, text up to the next tag) while reading a chunk at a time
+    pending = ''
+    while True:
+        chunk = stream.read(65536)
+        pending += chunk
+        parts = pending.split('<')
+        # The last part may continue in the next chunk
+        pending = parts.pop() if chunk else ''
+        for part in parts:
+            tag, _, value = part.partition('>')
+            if tag:
+                yield tag.strip().upper(), _unescape(value.strip())
+        if not chunk:
+            if pending:
+                tag, _, value = pending.partition('>')
+                yield tag.strip().upper(), _unescape(value.strip())
+            return
+
+
+def _unescape(value):
+    return value.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&') if '&' in value else value
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'ofx': read_ofx}
+
+
+# Normalising raw fields into transaction records
+
+def parse_amount(value, decimal='.'):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            amount = float(value)
+        except OverflowError:
+            raise RowError('bad amount %r' % value)
+    else:
+        text = str(value or '').strip()
+        negative = text.startswith('(') and text.endswith(')')
+        text = _AMOUNT_JUNK.sub('', text)
+        if not text:
+            raise RowError('missing amount')
+        separator = ',' if decimal == '.' else '.'
+        if separator in text:
+            # Never guess: 12,00 read as 1200 would import silently wrong
+            if not _GROUPED[decimal].match(text):
+                raise RowError('ambiguous amount %r; pass decimal=%s' % (value, separator))
+            text = text.replace(separator, '')
+        try:
+            amount = float(text.replace(decimal, '.'))
+        except ValueError:
+            raise RowError('bad amount %r' % value)
+        if negative:
+            amount = -amount
+    # JSON lines may hold NaN, Infinity or numbers beyond the cents columns
+    if not valid_amount(amount):
+        raise RowError('bad amount %r' % value)
+    return amount
+
+
+def parse_date(value, date_format=None):
+    text = str(value or '').strip()
+    if not text:
+        raise RowError('missing date')
+    try:
+        if date_format:
+            parsed = datetime.strptime(text, date_format)
+        elif text[:8].isdigit():
+            # OFX: YYYYMMDD[HHMM[SS[.XXX]]][TZ], kept as local time
+            digits = _DIGITS.match(text).group()[:12]
+            parsed = datetime.strptime(digits.ljust(12, '0'), '%Y%m%d%H%M')
+        else:
+            parsed = datetime.fromisoformat(text.replace('T', ' ')[:19])
+    except ValueError:
+        raise RowError('bad date %r%s' % (value, '' if date_format else '; pass date_format='))
+    return parsed.strftime(DATE_FORMAT)
+
+
+class Normalizer:
+    """Turns raw reader fields into transaction records for the store.
+
+    Categories are matched case-insensitively against the app's own; any
+    other value, or none, becomes ``default_category``. Text amounts use
+    ``decimal`` as the decimal mark, and the other of ``.`` and ``,`` only
+    between groups of thousands.
+    """
+
+    def __init__(self, categories, default_category=None, date_format=None, decimal='.'):
+        if decimal not in DECIMALS:
+            raise ValueError('decimal must be . or ,')
+        self.categories = {category.lower(): category for category in categories}
+        self.default_category = default_category or categories[0]
+        self.date_format = date_format
+        self.decimal = decimal
+
+    def __call__(self, fields):
+        if fields is None:
+            raise RowError('not a JSON object')
+        category = fields.get('category')
+        description = fields.get('description')
+        return {
+            'amount': parse_amount(fields.get('amount'), self.decimal),
+            'category': self.categories.get(str(category).strip().lower(), self.default_category)
+                        if category else self.default_category,
+            'description': str(description).strip() if description not in (None, '') else None,
+            'date': parse_date(fields.get('date'), self.date_format),
+        }
+
+
+# Export: generators of text chunks, one page of rows at a time
+
+EXPORT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def export_csv(pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for rows in pages:
+        writer.writerows((row['date'], '%.2f' % row['amount'], row['category'], row['description'] or '')
+                         for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_jsonl(pages):
+    for rows in pages:
+        yield ''.join(json.dumps({field: row[field] for field in FIELDS}) + '\n' for row in rows)
+
+
+EXPORTERS = {'csv': export_csv, 'jsonl': export_jsonl}